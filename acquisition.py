@@ -0,0 +1,281 @@
+import threading, time
+import numpy as np
+import serial
+from metrics import Metrics
+
+class Acquisition:
+
+    def __init__(self, target, signal_names, store, max_fails=10, acq_mode="poll", sample_time=1.0, stream_buffer=10000, pipeline_depth=4, enable_log=False, log_writer=None, channels=None, reconnect=False, reconnect_min=0.1, reconnect_max=2.0, reconnect_timeout=60.0, framed=False, poll_batch=10.0):
+        self.target = target
+        self.target_signal_names = list(signal_names) # All the signal names of the target, checked on reconnect
+        self.channels = channels # Indexes of the signals subscribed to, None for all of them
+        if channels is None:
+            self.signal_names = signal_names
+        else: # Frames, store and log hold the subscribed signals only
+            self.signal_names = [signal_names[signal_id] for signal_id in channels]
+        self.signal_length = len(self.signal_names)
+        self.store = store # Sample store read by the chart
+        self.max_fails = max_fails
+        self.acq_mode = acq_mode
+        self.sample_period = int(sample_time*1e6) # Request period in ns for poll and combined modes, 0 for as fast as possible
+        self.stream_buffer = stream_buffer
+        self.pipeline_depth = pipeline_depth
+        self.enable_log = enable_log
+        self.log_writer = log_writer # Writes the log to file instead of log_vals
+        self.capture = None # Logs only the windows around trigger events when set, everything otherwise
+        self.publisher = None # Broadcasts the blocks to other programs when set
+        self.log_vals = {} # Dictionary to store the values logged
+        self.reset_log_vals()
+        self.count = 0 # Samples acquired
+        self.fails = 0
+        self.exectime = np.nan # Last exec time received
+        self.running = False
+        self.thread = None
+        self.metrics = Metrics() # Sample rate, jitter and processing time
+        self.last_host_ns = None # Host time of the last sample
+        self.reconnect = reconnect # Reopen the port when the link is lost, instead of stopping
+        self.reconnect_min = reconnect_min # First wait before reopening (s), doubled at each attempt
+        self.reconnect_max = reconnect_max # Maximum wait between attempts (s)
+        self.reconnect_timeout = reconnect_timeout # Give up after this time (s), 0 for never
+        self.gaps = [] # Sample index and host times of each interruption of the link
+        self.wake = threading.Event() # Interrupts the reconnect waits on stop
+        self.framed = framed # Sample frames with sync marker, sequence number and CRC, poll mode then reads combined frames
+        self.poll_batch = int(poll_batch*1e6) # Polled samples are appended together over up to this time in ns, 0 for one by one
+        self.poll_pending = [] # Polled samples not appended yet, as (block, exectimes, host_ns)
+        self.subscribed = False # Steps of setup done on the target, the only ones undone by teardown
+        self.framing_set = False
+        self.mode_started = False
+
+        # Callbacks, called from the acquisition thread
+        self.on_reconnect = None # With True when the link is lost and reconnecting, False when back
+        self.on_error = None # When more than max_fails reads in a row failed
+        self.on_end = None # When a finite source has no more samples
+
+    def start(self):
+        # Set up the target and start the acquisition thread
+        if not self.setup():
+            return False
+        self.running = True
+        self.wake.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if not(self.thread is None) and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.teardown()
+
+    def setup(self):
+        # Subscription, framing and acquisition mode of the target
+        self.subscribed = False
+        self.framing_set = False
+        self.mode_started = False
+        if not(self.channels is None):
+            if not self.target.subscribe(self.channels):
+                return False
+            self.subscribed = True
+        if self.framed:
+            if not self.target.set_framing(True):
+                return False
+            self.framing_set = True
+        if self.acq_mode == "stream": # Target pushes frames from now on
+            if not self.target.start_stream(self.signal_length, self.stream_buffer):
+                return False
+            self.mode_started = True
+        elif self.acq_mode == "pipeline": # Fill the request pipeline
+            if not self.target.start_pipeline(self.signal_length, self.pipeline_depth):
+                return False
+            self.mode_started = True
+        return True
+
+    def teardown(self):
+        # Undo only what setup did, it may have stopped halfway
+        if self.mode_started and self.acq_mode == "stream":
+            self.target.stop_stream()
+        elif self.mode_started and self.acq_mode == "pipeline":
+            self.target.stop_pipeline()
+        if self.framing_set: # Back to raw frames
+            self.target.set_framing(False)
+        if self.subscribed: # Back to full frames
+            self.target.subscribe(None)
+        self.subscribed = False
+        self.framing_set = False
+        self.mode_started = False
+
+    def reopen(self):
+        # Reopen the port with backoff until the target answers with the same signals, returns False on timeout or stop
+        gap = {"sample": self.count, "start_ns": time.perf_counter_ns()}
+        self.metrics.count("disconnects")
+        if not(self.on_reconnect is None):
+            self.on_reconnect(True)
+        wait = self.reconnect_min
+        while self.running and (self.reconnect_timeout <= 0 or time.perf_counter_ns() - gap["start_ns"] < self.reconnect_timeout*1e9):
+            if self.wake.wait(wait):
+                break
+            wait = min(2*wait, self.reconnect_max)
+            self.metrics.count("reconnect_attempts")
+            try:
+                self.target.close()
+                self.target.open()
+            except (serial.SerialException, OSError) as e:
+                continue
+            if self.target.get_signames() != self.target_signal_names: # Other firmware, or not ready yet
+                self.metrics.count("reconnect_mismatches")
+                continue
+            if not self.setup():
+                continue
+
+            # Back on the same buffers and log, the gap is only recorded
+            gap["end_ns"] = time.perf_counter_ns()
+            self.gaps.append(gap)
+            self.metrics.count("reconnects")
+            self.metrics.observe("gap", gap["end_ns"] - gap["start_ns"])
+            self.last_host_ns = None # The gap is not an inter-sample interval
+            if not(self.on_reconnect is None):
+                self.on_reconnect(False)
+            return True
+        return False
+
+    def run(self):
+        next_time = time.perf_counter_ns()
+        while self.running:
+            read_start = time.perf_counter_ns()
+            if self.acq_mode == "stream": # Paced by the frames arriving
+                block, exectimes, host_ns = self.target.read_stream(self.target.timeout or 0.1)
+                if self.target.stream_error:
+                    block = None
+            elif self.acq_mode == "pipeline": # Paced by the replies arriving
+                block, exectimes = self.target.read_pipeline()
+                host_ns = np.full(0 if block is None else len(block), time.perf_counter_ns(), dtype=np.int64)
+            else: # Paced by the monotonic clock
+                if self.sample_period > 0:
+                    now = time.perf_counter_ns()
+                    if next_time > now:
+                        time.sleep((next_time - now)/1e9)
+                    next_time = max(next_time + self.sample_period, time.perf_counter_ns() - self.sample_period) # No burst after a stall
+                block, exectimes, host_ns = self.read_poll()
+            self.metrics.observe("read", time.perf_counter_ns() - read_start)
+
+            if block is None or len(block) == 0: # Link lost or target silent
+                self.append_poll_pending()
+                self.fails = self.fails + 1
+                self.metrics.count("fails")
+                if self.fails > self.max_fails and self.reconnect and self.reopen():
+                    self.fails = 0
+                    continue
+                if self.fails > self.max_fails:
+                    self.running = False
+                    if not(self.on_error is None):
+                        self.on_error()
+                continue
+            self.fails = 0 #Reset
+
+            # Polled samples are batched until the next one would be late for the batch time
+            if self.acq_mode in ("poll", "combined"):
+                self.poll_pending.append((block, exectimes, host_ns))
+                if host_ns[-1] - self.poll_pending[0][2][0] + self.sample_period >= self.poll_batch:
+                    self.append_poll_pending()
+                continue
+
+            process_start = time.perf_counter_ns()
+            self.append_block(block, exectimes, host_ns)
+            self.metrics.observe("process", time.perf_counter_ns() - process_start)
+        self.append_poll_pending()
+
+    def append_poll_pending(self):
+        # Append the batched polled samples as one block
+        if len(self.poll_pending) == 0:
+            return
+        process_start = time.perf_counter_ns()
+        block = np.concatenate([block for block, _, _ in self.poll_pending])
+        exectimes = np.concatenate([exectimes for _, exectimes, _ in self.poll_pending])
+        host_ns = np.concatenate([host_ns for _, _, host_ns in self.poll_pending])
+        self.poll_pending = []
+        self.append_block(block, exectimes, host_ns)
+        self.metrics.observe("process", time.perf_counter_ns() - process_start)
+
+    def read_poll(self):
+        # Read data as a block of one sample
+        combined = self.acq_mode == "combined" or self.framed
+        if combined: # Signals and exec time in one frame
+            block, exectimes, _ = self.target.get_signals_batch(1, self.signal_length)
+        else:
+            data_bytes = self.target.get_signal_bytes(self.signal_length)
+            if data_bytes is None:
+                return None, None, None
+            block = np.frombuffer(data_bytes, dtype=np.float32).reshape(1, self.signal_length)
+        host_ns = np.array([time.perf_counter_ns()], dtype=np.int64)
+        if block is None:
+            return None, None, None
+
+        # Get exec time
+        if not combined:
+            exectime = self.target.get_exectime()
+            exectimes = np.array([np.nan if exectime is None else exectime], dtype=np.float32)
+        return block, exectimes, host_ns
+
+    def append_block(self, block, exectimes, host_ns):
+        # Append an (n, signal_length) block of samples
+        self.store.append(block, self.count, host_ns, exectimes)
+        if not(self.publisher is None):
+            self.publisher.publish(self.count, exectimes, block, host_ns)
+
+        # Log data, only the capture windows with a trigger
+        if not(self.capture is None) and (self.enable_log or not(self.log_writer is None)):
+            self.capture.process(self.count, exectimes, block, host_ns, self.log_block)
+        else:
+            self.log_block(self.count, exectimes, block, host_ns)
+
+        # Sample rate and inter-sample jitter from the host times
+        self.metrics.count("samples", len(block))
+        if self.acq_mode in ("stream", "pipeline"): # The samples of a read share its host time, one mean interval per block
+            if not(self.last_host_ns is None):
+                self.metrics.observe("interval", (host_ns[-1] - self.last_host_ns)/len(block))
+        elif self.last_host_ns is None:
+            self.metrics.observe("interval", np.diff(host_ns))
+        else:
+            self.metrics.observe("interval", np.diff(host_ns, prepend=self.last_host_ns))
+        self.last_host_ns = host_ns[-1]
+
+        # Increment the count
+        self.count = self.count + len(block)
+        self.exectime = exectimes[-1]
+
+    def log_block(self, first_index: int, exectimes, block, host_ns):
+        if not(self.log_writer is None):
+            self.log_writer.write(first_index, exectimes, block, host_ns)
+        elif self.enable_log:
+            self.log_vals["sample"].extend(range(first_index, first_index + len(block)))
+            self.log_vals["time"].extend(exectimes.tolist())
+            self.log_vals["host_ns"].extend(host_ns.tolist())
+            for signal_id, signal_name in enumerate(self.signal_names):
+                self.log_vals[signal_name].extend(block[:, signal_id].tolist())
+
+    def reset_log_vals(self):
+        self.log_vals = {}
+        for signal_name in self.signal_names:
+            self.log_vals[signal_name] = []
+        self.log_vals["sample"] = []
+        self.log_vals["time"] = []
+        self.log_vals["host_ns"] = []
+
+def collect_gaps(acquisition):
+    # Interruptions of the links of an acquisition, or of those merged by it, with the port of the target
+    acquisitions = getattr(acquisition, "acquisitions", [acquisition])
+    return [dict(gap, port=sub.target.port) for sub in acquisitions if not(sub.target is None) for gap in sub.gaps]
+
+def collect_metrics(targets, acquisition, capture=None, live=None, full=False):
+    # Metrics of the links, the acquisition with its gaps and captures, and the publisher, as saved next to the log
+    metrics = {"link": targets[0].metrics.snapshot(full)}
+    for k, target in enumerate(targets[1:], 1): # Links of the extra targets
+        metrics[f"link_{k}"] = target.metrics.snapshot(full)
+    metrics["acquisition"] = acquisition.metrics.snapshot(full)
+    metrics["gaps"] = collect_gaps(acquisition)
+    if not(capture is None):
+        metrics["captures"] = list(capture.captures)
+    if not(live is None):
+        metrics["publisher"] = live.metrics.snapshot(full)
+    return metrics
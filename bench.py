@@ -0,0 +1,159 @@
+import argparse, json, os, subprocess, sys, tempfile, time, zlib
+import numpy as np
+import sbbtarget, logwriter
+from samplestore import SampleStore
+from acquisition import Acquisition
+
+# Benchmark of the acquisition and rendering path against the simulated target
+
+def start_sim(num_sig, rate, latency, noise, corrupt=0.0):
+    # Simulated target in a separate process, so that its CPU time is not counted
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simtarget.py")
+    proc = subprocess.Popen([sys.executable, script, "--signals", str(num_sig), "--rate", str(rate), "--latency", str(latency), "--noise", str(noise), "--corrupt", str(corrupt)], stdout=subprocess.PIPE, text=True)
+    port = proc.stdout.readline().strip()
+    return proc, port
+
+def bench_acquisition(mode, num_sig, args):
+    proc, port = start_sim(num_sig, args.rate, args.latency, args.noise, args.corrupt)
+    try:
+        target = sbbtarget.SBBTarget()
+        target.port = port
+        target.timeout = 0.1
+        target.open()
+        signal_names = target.get_signames()
+        store = SampleStore(max(args.windows), len(signal_names))
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_writer = logwriter.LogWriter(os.path.join(log_dir, "bench.sbblog"), signal_names) if args.log else None
+            acquisition = Acquisition(target, signal_names, store, 10, mode, 0, 100000, args.pipeline_depth, False, log_writer, framed=args.framed)
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            acquisition.start()
+            time.sleep(args.duration)
+            acquisition.stop()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            if not(log_writer is None):
+                log_writer.close()
+        target.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    samples = max(acquisition.count, 1)
+    rtt = target.metrics.snapshot()["histograms"].get("rtt", {})
+    return {
+        "mode": mode,
+        "signals": num_sig,
+        "samples_per_s": acquisition.count/wall,
+        "cpu_us_per_sample": cpu/samples*1e6,
+        "rtt_p50_us": rtt["p50_us"] if rtt.get("count", 0) > 0 else "-", # No requests in stream mode
+        "dropped": target.stream_dropped,
+        "lost": target.frames_lost,
+    }
+
+def bench_decode(num_sig, num_frames=10000, repeat=20):
+    # Decoding of a bulk read of num_frames frames
+    target = sbbtarget.SBBTarget()
+    data_bytes = np.random.default_rng(0).random((num_frames, num_sig + 1), dtype=np.float32).tobytes()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        target.decode_frames(data_bytes, num_sig)
+    decode = (time.perf_counter() - start)/(repeat*num_frames)*1e9
+
+    # Same frames with sync marker, sequence number and CRC, checked before decoding
+    frame_size = (num_sig + 1)*4
+    bodies = [(k % 65536).to_bytes(2, "little") + data_bytes[k*frame_size:(k + 1)*frame_size] for k in range(num_frames)]
+    framed_bytes = b''.join(b'\xa5\x5a' + body + zlib.crc32(body).to_bytes(4, "little") for body in bodies)
+    target.framed = True
+    start = time.perf_counter()
+    for _ in range(repeat):
+        target.frame_pending = bytearray()
+        target.frame_seq = None
+        target.decode_frames(target.unframe(framed_bytes, num_sig)[0], num_sig)
+    return {"signals": num_sig, "decode_ns_per_sample": decode, "framed_ns_per_sample": (time.perf_counter() - start)/(repeat*num_frames)*1e9}
+
+def bench_append(num_sig, block_size, window, duration=0.5):
+    # Append of acquired blocks to the store and the log file
+    signal_names = [f"signal {i}" for i in range(num_sig)]
+    block = np.random.default_rng(0).random((block_size, num_sig), dtype=np.float32)
+    exectimes = np.zeros(block_size, dtype=np.float32)
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_writer = logwriter.LogWriter(os.path.join(log_dir, "bench.sbblog"), signal_names)
+        acquisition = Acquisition(None, signal_names, SampleStore(window, num_sig), log_writer=log_writer)
+        blocks = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            acquisition.append_block(block, exectimes, np.full(block_size, time.perf_counter_ns(), dtype=np.int64))
+            blocks = blocks + 1
+        elapsed = time.perf_counter() - start
+        log_writer.close()
+    return {"signals": num_sig, "block": block_size, "append_ns_per_sample": elapsed/(blocks*block_size)*1e9}
+
+def bench_chart(num_sig, window, render_mode, repeat=20):
+    # update_signal_chart with all the signals visible and a full window
+    from PySide6.QtWidgets import QApplication
+    from sbbpygui import SBBPyGui
+    app = QApplication.instance() or QApplication(sys.argv)
+    gui = SBBPyGui()
+    app.processEvents() # Builds the chart
+    gui.settings["gui"]["chart_window"] = window
+    gui.settings["gui"]["render_mode"] = render_mode
+    gui.set_signal_names([f"signal {i}" for i in range(num_sig)])
+    gui.selected_names = set(gui.signal_names)
+    gui.update_series_visibility()
+    gui.set_channels(list(range(num_sig)))
+    gui.store = SampleStore(window, num_sig)
+    gui.store.append(np.random.default_rng(0).random((window, num_sig), dtype=np.float32), 0, np.zeros(window, dtype=np.int64))
+    gui.resize(1200, 800)
+    app.processEvents()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        gui.update_signal_chart(window - 1)
+        app.processEvents() # Includes the repaint
+    elapsed = time.perf_counter() - start
+    gui.close()
+    return {"signals": num_sig, "window": window, "render_mode": render_mode, "chart_ms_per_update": elapsed/repeat*1e3}
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    if len(rows) == 0:
+        return
+    keys = list(rows[0].keys())
+    print("  ".join(f"{key:>20}" for key in keys))
+    for row in rows:
+        print("  ".join(f"{value:>20.2f}" if isinstance(value, float) else f"{value:>20}" for value in row.values()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SBB acquisition and rendering benchmark")
+    parser.add_argument("--signals", type=int, nargs="+", default=[10, 50, 100], help="signal counts")
+    parser.add_argument("--windows", type=int, nargs="+", default=[500, 10000, 100000], help="chart windows")
+    parser.add_argument("--modes", nargs="+", default=["poll", "combined", "pipeline", "stream"], help="acquisition modes")
+    parser.add_argument("--render-modes", nargs="+", default=["full", "minmax", "lttb"], help="chart render modes")
+    parser.add_argument("--duration", type=float, default=2.0, help="duration of each acquisition run (s)")
+    parser.add_argument("--rate", type=float, default=10000.0, help="simulated frame rate in stream mode (Hz)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated reply latency (ms)")
+    parser.add_argument("--noise", type=float, default=0.01, help="simulated noise standard deviation")
+    parser.add_argument("--pipeline-depth", type=int, default=8, help="requests in flight in pipeline mode")
+    parser.add_argument("--framed", action="store_true", help="acquire with sync marker, sequence number and CRC on each frame")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="simulated probability of a corrupt frame (with --framed)")
+    parser.add_argument("--log", action="store_true", help="stream the log to a temporary file while acquiring")
+    parser.add_argument("--no-chart", action="store_true", help="skip the chart benchmark (no Qt)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__))) # settings.json
+
+    results = {}
+    results["acquisition"] = [bench_acquisition(mode, num_sig, args) for num_sig in args.signals for mode in args.modes]
+    print_table("Acquisition", results["acquisition"])
+    results["decode"] = [bench_decode(num_sig) for num_sig in args.signals]
+    print_table("Decoding", results["decode"])
+    results["append"] = [bench_append(num_sig, block_size, max(args.windows)) for num_sig in args.signals for block_size in (1, 10, 100)]
+    print_table("Store and log append", results["append"])
+    if not args.no_chart:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        results["chart"] = [bench_chart(num_sig, window, render_mode) for num_sig in args.signals for window in args.windows for render_mode in args.render_modes]
+        print_table("Chart update", results["chart"])
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=1)
@@ -0,0 +1,59 @@
+import numpy as np
+
+def minmax(x, y, num_buckets: int):
+    # Keep the min and max of each bucket in time order, so that peaks survive
+    n = len(y)
+    if n <= 2*num_buckets or num_buckets < 1:
+        return x, y
+    size = n // num_buckets
+    head = num_buckets*size # Samples in the equally sized buckets
+
+    # Position of min and max within each bucket
+    buckets = y[:head].reshape(num_buckets, size)
+    offsets = np.arange(num_buckets)*size
+    imin = offsets + np.argmin(buckets, axis=1)
+    imax = offsets + np.argmax(buckets, axis=1)
+
+    # The remainder is appended as a last bucket
+    if head < n:
+        imin = np.append(imin, head + np.argmin(y[head:]))
+        imax = np.append(imax, head + np.argmax(y[head:]))
+
+    # Interleave keeping the time order within each bucket
+    first = np.minimum(imin, imax)
+    second = np.maximum(imin, imax)
+    idx = np.column_stack((first, second)).ravel()
+    return x[idx], y[idx]
+
+def lttb(x, y, num_out: int):
+    # Largest-Triangle-Three-Buckets: per bucket keep the point forming the largest triangle with
+    # the averages of the previous and the next bucket, so that all the buckets are done at once
+    n = len(y)
+    if n <= num_out or num_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, num_out - 1).astype(np.int64) # num_out - 2 buckets between first and last
+    starts = edges[:-1] - 1 # Bucket starts within the inner points
+    counts = np.diff(edges)
+    inner_x = np.asarray(x[1:n - 1], dtype=np.float64)
+    inner_y = np.asarray(y[1:n - 1], dtype=np.float64)
+
+    # Averages of each bucket without the NaNs, the first and last points stand for the buckets before and after
+    finite = ~np.isnan(inner_y)
+    with np.errstate(invalid="ignore"): # NaN for the buckets without values
+        avg_x = np.add.reduceat(inner_x, starts)/counts
+        avg_y = np.add.reduceat(np.where(finite, inner_y, 0), starts)/np.add.reduceat(finite, starts)
+    ax = np.repeat(np.concatenate(([x[0]], avg_x[:-1])), counts)
+    ay = np.repeat(np.concatenate(([y[0]], avg_y[:-1])), counts)
+    cx = np.repeat(np.append(avg_x[1:], x[-1]), counts)
+    cy = np.repeat(np.append(avg_y[1:], y[-1]), counts)
+    area = np.abs((ax - cx)*(inner_y - ay) - (ax - inner_x)*(cy - ay))
+    area[np.isnan(area)] = -1 # Never preferred, a bucket of NaNs keeps its first point
+
+    # First point with the largest area in each bucket
+    largest = np.repeat(np.maximum.reduceat(area, starts), counts)
+    candidates = np.where(area == largest, np.arange(n - 2), n)
+    idx = np.empty(num_out, dtype=np.int64)
+    idx[0] = 0
+    idx[1:-1] = np.minimum.reduceat(candidates, starts) + 1
+    idx[-1] = n - 1
+    return x[idx], y[idx]
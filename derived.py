@@ -0,0 +1,39 @@
+import functools
+import numpy as np
+
+# Channels derived from a signal, computed over the whole chart window at once
+kinds = {"lowpass": "Low-pass", "highpass": "High-pass", "derivative": "Derivative", "psd": "Spectrum"}
+spectral_kinds = ("psd",) # Plotted against frequency instead of sample
+
+def derived_name(kind: str, signal_name: str):
+    return f"{kind}({signal_name})"
+
+def sample_rate(host_ns):
+    # Mean sample rate in Hz over the host times, None when unknown
+    # Samples read in the same block share their host time, so the median step would be 0
+    if len(host_ns) < 2 or host_ns[-1] <= host_ns[0]:
+        return None
+    return (len(host_ns) - 1)*1e9/float(host_ns[-1] - host_ns[0])
+
+@functools.lru_cache(maxsize=32)
+def butter_sos(kind: str, cutoff: float, fs: float, order: int):
+    from scipy.signal import butter # Imported on first use
+    return butter(order, min(cutoff, 0.49*fs), btype="low" if kind == "lowpass" else "high", fs=fs, output="sos")
+
+def compute(kind: str, y, fs: float, cutoff: float = 5.0, order: int = 2, segment: int = 1024):
+    # Returns (frequencies, values) for the spectral kinds, (None, values) otherwise
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64)) # NaNs would spread over the window
+    if kind == "derivative":
+        return None, np.gradient(y)*fs if len(y) > 1 else np.zeros(len(y))
+    if kind in ("lowpass", "highpass"):
+        from scipy.signal import sosfiltfilt
+        sos = butter_sos(kind, cutoff, float(f"{fs:.3g}"), order) # Rounded, so that the filter is reused
+        if len(y) <= 3*(2*len(sos) + 1): # Too short for the zero-phase padding
+            return None, y
+        return None, sosfiltfilt(sos, y)
+    if kind == "psd": # Welch estimate over the window
+        from scipy.signal import welch
+        if len(y) < 8:
+            return np.zeros(0), np.zeros(0)
+        return welch(y, fs, nperseg=min(segment, len(y)))
+    raise ValueError(f"Unknown derived channel {kind}")
@@ -0,0 +1,139 @@
+import numpy as np
+
+class History:
+
+    def __init__(self, num_sig: int, bucket: int = 64, factor: int = 4):
+        # Min and max of each signal over the whole session, at several resolutions:
+        # bucket k of level l covers the sample indexes [k*size, (k+1)*size) with size = bucket*factor**l
+        # Only completed level 0 buckets are in the levels, the one being filled is kept aside
+        self.num_sig = num_sig
+        self.bucket = bucket
+        self.factor = factor
+        self.count = 0 # Sample index after the last one appended
+        self.mins = [] # (capacity, num_sig) arrays, one per level
+        self.maxs = []
+        self.lengths = [] # Buckets in use at each level
+        self.partial_min = np.full(num_sig, np.nan, dtype=np.float32) # Level 0 bucket being filled
+        self.partial_max = np.full(num_sig, np.nan, dtype=np.float32)
+
+    def size(self, level: int):
+        # Samples per bucket at level
+        return self.bucket*self.factor**level
+
+    def completed(self):
+        # Samples covered by the levels
+        return (self.lengths[0] if len(self.lengths) > 0 else 0)*self.bucket
+
+    def reserve(self, level: int, length: int):
+        # Room for length buckets at level, the arrays double when full
+        if level == len(self.mins):
+            self.mins.append(np.full((16, self.num_sig), np.nan, dtype=np.float32))
+            self.maxs.append(np.full((16, self.num_sig), np.nan, dtype=np.float32))
+            self.lengths.append(0)
+        capacity = len(self.mins[level])
+        if length > capacity:
+            capacity = max(2*capacity, length)
+            for arrays in (self.mins, self.maxs):
+                grown = np.full((capacity, self.num_sig), np.nan, dtype=np.float32)
+                grown[:self.lengths[level]] = arrays[level][:self.lengths[level]]
+                arrays[level] = grown
+        self.lengths[level] = max(self.lengths[level], length)
+
+    def append(self, block, first_index: int):
+        # Fold consecutive (n, num_sig) samples into the bucket being filled, the levels are only
+        # updated when buckets complete, NaNs are ignored
+        n = len(block)
+        if n == 0:
+            return
+        take = min(n, self.bucket - first_index % self.bucket)
+        if take == 1: # Single sample, the common case of the polled modes
+            np.fmin(self.partial_min, block[0], out=self.partial_min)
+            np.fmax(self.partial_max, block[0], out=self.partial_max)
+        else:
+            np.fmin(self.partial_min, np.fmin.reduce(block[:take], axis=0), out=self.partial_min)
+            np.fmax(self.partial_max, np.fmax.reduce(block[:take], axis=0), out=self.partial_max)
+        self.count = first_index + n
+        if (first_index + take) % self.bucket != 0: # Bucket still being filled
+            return
+        first_bucket = first_index // self.bucket
+        mins = [self.partial_min[np.newaxis]]
+        maxs = [self.partial_max[np.newaxis]]
+
+        # Whole buckets in the rest of the block, then the start of the next one
+        rest = block[take:]
+        full = len(rest) // self.bucket
+        if full > 0:
+            buckets = rest[:full*self.bucket].reshape(full, self.bucket, self.num_sig)
+            mins.append(np.fmin.reduce(buckets, axis=1))
+            maxs.append(np.fmax.reduce(buckets, axis=1))
+        tail = rest[full*self.bucket:]
+        self.partial_min = np.fmin.reduce(tail, axis=0) if len(tail) > 0 else np.full(self.num_sig, np.nan, dtype=np.float32)
+        self.partial_max = np.fmax.reduce(tail, axis=0) if len(tail) > 0 else np.full(self.num_sig, np.nan, dtype=np.float32)
+        self.push(first_bucket, np.concatenate(mins), np.concatenate(maxs))
+
+    def push(self, first_bucket: int, mins, maxs):
+        # Store completed level 0 buckets and fold them into the buckets above, up to a single bucket
+        level = 0
+        while True:
+            last_bucket = first_bucket + len(mins) - 1
+            self.reserve(level, last_bucket + 1)
+            rows = slice(first_bucket, last_bucket + 1)
+            np.fmin(self.mins[level][rows], mins, out=self.mins[level][rows])
+            np.fmax(self.maxs[level][rows], maxs, out=self.maxs[level][rows])
+            if self.lengths[level] <= 1:
+                return
+            if level + 1 == len(self.mins): # New level, built from all the buckets below
+                first_bucket = 0
+            start = first_bucket - first_bucket % self.factor
+            starts = np.arange(first_bucket // self.factor, last_bucket // self.factor + 1)*self.factor - start
+            mins = np.fmin.reduceat(self.mins[level][start:last_bucket + 1], starts, axis=0)
+            maxs = np.fmax.reduceat(self.maxs[level][start:last_bucket + 1], starts, axis=0)
+            first_bucket = first_bucket // self.factor
+            level = level + 1
+
+    def query(self, columns, first: float, last: float, width: int):
+        # Min and max of columns between the sample indexes first and last, at the coarsest level with
+        # at least one bucket per pixel of width, returns x and one y array per column, min and max per bucket
+        completed = self.completed()
+        if self.count == 0 or len(columns) == 0:
+            return np.zeros(0), [np.zeros(0) for _ in columns]
+        centers = np.zeros(0)
+        mins = np.zeros((0, len(columns)), dtype=np.float32)
+        maxs = mins
+        if completed > 0:
+            level = 0
+            while level + 1 < len(self.mins) and (last - first)/self.size(level + 1) >= width:
+                level = level + 1
+            size = self.size(level)
+            first_bucket = min(max(int(first) // size - 1, 0), self.lengths[level] - 1) # One more on each side, for the lines to the borders
+            last_bucket = min(max(int(last) // size + 1, 0), self.lengths[level] - 1)
+            buckets = np.arange(first_bucket, last_bucket + 1)
+            centers = (buckets*size + np.minimum((buckets + 1)*size, completed))/2 # The last bucket may be partly filled
+            mins = self.mins[level][first_bucket:last_bucket + 1][:, columns]
+            maxs = self.maxs[level][first_bucket:last_bucket + 1][:, columns]
+            if last + size < completed: # Range ends before the bucket being filled
+                return self.pairs(centers, mins, maxs)
+        centers = np.append(centers, (completed + self.count - 1)/2)
+        mins = np.vstack((mins, self.partial_min[columns]))
+        maxs = np.vstack((maxs, self.partial_max[columns]))
+        return self.pairs(centers, mins, maxs)
+
+    def pairs(self, centers, mins, maxs):
+        # x repeated and min and max interleaved, for a single line through both
+        x = np.repeat(centers, 2).astype(np.float64)
+        ys = [np.column_stack((mins[:, k], maxs[:, k])).ravel().astype(np.float64) for k in range(mins.shape[1])]
+        return x, ys
+
+    def extrema(self, columns):
+        # Min and max of columns over the whole session, None when unknown
+        if self.count == 0 or len(columns) == 0:
+            return None, None
+        min_value = np.fmin.reduce(self.partial_min[columns])
+        max_value = np.fmax.reduce(self.partial_max[columns])
+        if len(self.mins) > 0:
+            top = len(self.mins) - 1
+            min_value = np.fmin(min_value, np.fmin.reduce(self.mins[top][:self.lengths[top], columns], axis=None))
+            max_value = np.fmax(max_value, np.fmax.reduce(self.maxs[top][:self.lengths[top], columns], axis=None))
+        if np.isnan(min_value): # Only NaNs
+            return None, None
+        return float(min_value), float(max_value)
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+
+chunk_size = 100000 # Rows converted at a time
+formats = {".mat": "MAT file (*.mat)", ".npz": "NumPy archive (*.npz)", ".npy": "NumPy array (*.npy)"}
+
+def log_columns(log_vals):
+    # Output name, key in log_vals and type of each logged column
+    return [(key.replace(' ', '_'), key, np.int64 if key in ("sample", "host_ns") else np.float32) for key in log_vals]
+
+def export_log(log_vals, filename: str):
+    # Generator exporting the log in chunks, yields the fraction done
+    # Closing it before the end removes the partial file
+    ext = os.path.splitext(filename)[1].lower()
+    if not(ext in formats):
+        raise ValueError(f"Unknown log format {ext}")
+    columns = log_columns(log_vals)
+    num_rows = len(log_vals["sample"])
+    completed = False
+    try:
+        if ext == ".npy": # One structured array, filled in place through a memory map
+            dtype = np.dtype([(name, dtype) for name, _, dtype in columns])
+            out = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(num_rows,))
+            for start in range(0, num_rows, chunk_size):
+                stop = min(start + chunk_size, num_rows)
+                for name, key, _ in columns:
+                    out[name][start:stop] = np.asarray(log_vals[key][start:stop])
+                yield stop/num_rows
+            out.flush()
+            del out
+            completed = True
+            yield 1.0
+        else: # Contiguous arrays converted once, then written in one go
+            arrays = {name: np.empty(num_rows, dtype=dtype) for name, _, dtype in columns}
+            for start in range(0, num_rows, chunk_size):
+                stop = min(start + chunk_size, num_rows)
+                for name, key, _ in columns:
+                    arrays[name][start:stop] = np.asarray(log_vals[key][start:stop])
+                yield 0.8*stop/num_rows
+            if ext == ".npz":
+                np.savez(filename, **arrays)
+            else:
+                from scipy.io import savemat
+                savemat(filename, arrays, appendmat=False, oned_as='column', long_field_names=True)
+            completed = True
+            yield 1.0
+    finally:
+        if not completed and os.path.exists(filename):
+            os.remove(filename)
@@ -0,0 +1,103 @@
+import json, os, queue, struct, threading
+import numpy as np
+
+# Log file layout:
+#   magic (6 bytes), version (uint16), header length (uint32), JSON header padded to header_align
+#   fixed-size records (sample index, host time, exec time, raw frame) up to the end of the file
+magic = b'SBBLOG'
+version = 2
+header_align = 64
+prefix = struct.Struct('<6sHI')
+
+def record_dtype(num_sig: int, file_version: int = version):
+    if file_version < 2: # Without host time
+        return np.dtype([("sample", "<i8"), ("time", "<f4"), ("data", "<f4", (num_sig,))])
+    return np.dtype([("sample", "<i8"), ("host_ns", "<i8"), ("time", "<f4"), ("data", "<f4", (num_sig,))])
+
+class LogWriter:
+
+    def __init__(self, filename: str, signal_names, flush_time: float = 0.5):
+        self.filename = filename
+        self.signal_names = list(signal_names)
+        self.dtype = record_dtype(len(self.signal_names))
+        self.flush_time = flush_time # Maximum time before the records reach the disk
+        self.records = 0 # Records written so far
+        self.queue = queue.Queue()
+
+        # Write the header straight away, so that even an empty session can be opened
+        self.file = open(filename, "wb")
+        header = json.dumps({"signal_names": self.signal_names, "record_size": self.dtype.itemsize}).encode("utf-8")
+        length = -(-(prefix.size + len(header)) // header_align)*header_align - prefix.size
+        self.file.write(prefix.pack(magic, version, length) + header.ljust(length))
+        self.file.flush()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, first_index: int, exectimes, block, host_ns):
+        # Queue an (n, num_sig) block of raw float32 frames, never blocks the caller
+        records = np.empty(len(block), dtype=self.dtype)
+        records["sample"] = np.arange(first_index, first_index + len(block))
+        records["host_ns"] = host_ns
+        records["time"] = exectimes
+        records["data"] = block
+        self.queue.put(records)
+
+    def run(self):
+        running = True
+        while running:
+            # Collect what arrives within flush_time and write it as a single chunk
+            chunk = []
+            try:
+                chunk.append(self.queue.get(timeout=self.flush_time))
+                while True:
+                    chunk.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if len(chunk) > 0 and chunk[-1] is None: # Closing
+                running = False
+                del chunk[-1]
+            if len(chunk) == 0:
+                continue
+            data = np.concatenate(chunk)
+            self.file.write(data.tobytes())
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records = self.records + len(data)
+
+    def close(self):
+        # Write the queued records and close the file
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+def read_header(filename: str):
+    # Returns the JSON header and the offset of the first record
+    with open(filename, "rb") as file:
+        file_magic, file_version, length = prefix.unpack(file.read(prefix.size))
+        if file_magic != magic:
+            raise ValueError(f"{filename} is not a SBB log file")
+        header = json.loads(file.read(length).decode("utf-8"))
+    header["version"] = file_version
+    return header, prefix.size + length
+
+def open_log(filename: str):
+    # Memory-map the records, a record truncated by a crash is ignored
+    header, offset = read_header(filename)
+    dtype = record_dtype(len(header["signal_names"]), header["version"])
+    num_records = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if num_records == 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(num_records,))
+
+def load_log(filename: str):
+    # Dictionary of the logged values, as collected by the Executer in memory
+    header, records = open_log(filename)
+    log_vals = {}
+    for signal_id, signal_name in enumerate(header["signal_names"]):
+        log_vals[signal_name] = records["data"][:, signal_id]
+    log_vals["sample"] = records["sample"]
+    log_vals["time"] = records["time"]
+    if "host_ns" in records.dtype.names:
+        log_vals["host_ns"] = records["host_ns"]
+    return log_vals
@@ -1,9 +1,35 @@
-import sys
-from PySide6.QtWidgets import QApplication
-from sbbpygui import SBBPyGui
+import argparse, sys, time
+import record # No Qt import
+
+def print_startup_report(times):
+    print("Startup times:", file=sys.stderr)
+    for phase, duration in times.items():
+        print(f"  {phase:>16}: {duration*1e3:8.1f} ms", file=sys.stderr)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    start = time.perf_counter()
+    parser = argparse.ArgumentParser(description="SBB host")
+    parser.add_argument("--headless", action="store_true", help="record to file without the GUI")
+    parser.add_argument("--startup-report", action="store_true", help="print the duration of each startup phase")
+    record.add_arguments(parser)
+    args, qt_args = parser.parse_known_args()
+
+    if args.headless: # No Qt import at all
+        sys.exit(record.main(args))
+
+    phase_start = time.perf_counter()
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTimer
+    from sbbpygui import SBBPyGui
+    import_time = time.perf_counter() - phase_start
+    app = QApplication(sys.argv[:1] + qt_args)
     window = SBBPyGui()
     window.show()
+    if args.startup_report: # Reported once the chart is built and the first events are processed
+        def report():
+            times = {"import": import_time}
+            times.update(window.startup_times)
+            times["total"] = time.perf_counter() - start
+            print_startup_report(times)
+        QTimer.singleShot(0, report)
     sys.exit(app.exec())
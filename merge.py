@@ -0,0 +1,132 @@
+import os, threading, time
+import numpy as np
+from acquisition import Acquisition
+from samplestore import SampleStore
+
+def merged_names(ports, names_list):
+    # Signal names of the merged session, prefixed with the port of each target
+    return [f"{os.path.basename(port)}.{name}" for port, names in zip(ports, names_list) for name in names]
+
+def create_acquisition(targets, target_signal_names, signal_names, store, comm, enable_log=False, log_writer=None, channels=None):
+    # Acquisition of a single target, or one per target with its own store merged into store, from the comm settings
+    reconnect = (comm["reconnect"], comm["reconnect_min"]/1000, comm["reconnect_max"]/1000, comm["reconnect_timeout"]/1000)
+    if len(targets) == 1:
+        return Acquisition(targets[0], signal_names, store, comm["max_fails"], comm["acq_mode"], comm["sample_time"], comm["stream_buffer"], comm["pipeline_depth"], enable_log, log_writer, channels, *reconnect, framed=comm["framed"], poll_batch=comm["poll_batch"])
+    acquisitions = [Acquisition(target, names, SampleStore(max(comm["stream_buffer"], 1), len(names)), comm["max_fails"], comm["acq_mode"], comm["sample_time"], comm["stream_buffer"], comm["pipeline_depth"], False, None, None, *reconnect, framed=comm["framed"], poll_batch=comm["poll_batch"]) for target, names in zip(targets, target_signal_names)]
+    return Merger(acquisitions, signal_names, store, comm["merge_on"], comm["merge_delay"]/1000, comm["merge_tolerance"]/1000, enable_log, log_writer)
+
+class Merger(Acquisition):
+
+    def __init__(self, acquisitions, signal_names, store, merge_on="host", delay=0.05, tolerance=0.01, enable_log=False, log_writer=None, period=0.005):
+        # Merges the samples of several acquisitions, each with its own target, thread and store,
+        # into one session paced by the first one (the reference)
+        super().__init__(None, signal_names, store, enable_log=enable_log, log_writer=log_writer)
+        self.acquisitions = acquisitions
+        self.merge_on = merge_on # Align on the "host" arrival times or on the "exec" times of the targets
+        self.delay = delay # Maximum wait for the slower targets (s)
+        self.tolerance = tolerance # Maximum age of a sample held for a reference sample (s), NaN beyond
+        self.period = period # Time between merges (s)
+        self.positions = [0]*len(acquisitions) # Next sample index to fetch from each store
+        self.pending = [self.empty(acquisition.signal_length) for acquisition in acquisitions] # (keys, data, host times, exec times) not merged yet
+        self.lost = [False]*len(acquisitions)
+        self.merge_lock = threading.Lock()
+        for k, acquisition in enumerate(acquisitions):
+            acquisition.on_error = lambda k=k: self.on_target_error(k)
+            acquisition.on_reconnect = self.on_target_reconnect
+
+    def empty(self, num_sig: int):
+        return np.zeros(0), np.zeros((0, num_sig), dtype=np.float32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    def start(self):
+        for k, acquisition in enumerate(self.acquisitions):
+            if not acquisition.start():
+                for started in self.acquisitions[:k]:
+                    started.stop()
+                return False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if not(self.thread is None) and self.thread is not threading.current_thread():
+            self.thread.join()
+        for acquisition in self.acquisitions:
+            acquisition.stop()
+        self.merge(flush=True) # Samples left after the last merge
+
+    def on_target_error(self, k: int):
+        # Called from the acquisition thread of target k, the others keep going
+        self.lost[k] = True
+        self.metrics.count("targets_lost")
+        if k == 0: # The reference paces the session
+            self.running = False
+            if not(self.on_error is None):
+                self.on_error()
+
+    def on_target_reconnect(self, reconnecting: bool):
+        if not(self.on_reconnect is None):
+            self.on_reconnect(reconnecting)
+
+    def run(self):
+        while self.running:
+            time.sleep(self.period)
+            process_start = time.perf_counter_ns()
+            if self.merge() > 0:
+                self.metrics.observe("process", time.perf_counter_ns() - process_start)
+
+    def fetch(self, k: int):
+        # Move the new samples of target k from its store to the pending ones
+        acquisition = self.acquisitions[k]
+        with acquisition.store.lock:
+            index, data, host_ns, exectimes = acquisition.store.since(self.positions[k])
+        if len(index) == 0:
+            return
+        if index[0] > self.positions[k]: # Overwritten before being merged
+            self.metrics.count("dropped", int(index[0] - self.positions[k]))
+        self.positions[k] = int(index[-1]) + 1
+        keys = host_ns/1e9 if self.merge_on == "host" else exectimes.astype(np.float64)
+        self.pending[k] = tuple(np.concatenate((old, new)) for old, new in zip(self.pending[k], (keys, data, host_ns, exectimes)))
+
+    def merge(self, flush: bool = False):
+        # Merge the reference samples the other targets have caught up with, returns the samples merged
+        with self.merge_lock:
+            for k in range(len(self.acquisitions)):
+                self.fetch(k)
+            ref_keys, ref_data, ref_host_ns, ref_exectimes = self.pending[0]
+            if len(ref_keys) == 0:
+                return 0
+
+            # Wait for the slower targets, but at most delay
+            horizon = ref_keys[-1]
+            if not flush:
+                for k in range(1, len(self.acquisitions)):
+                    if not self.lost[k]:
+                        keys = self.pending[k][0]
+                        horizon = min(horizon, keys[-1] if len(keys) > 0 else -np.inf)
+                horizon = max(horizon, ref_keys[-1] - self.delay)
+            n = int(np.searchsorted(ref_keys, horizon, side="right"))
+            if n == 0:
+                return 0
+            merge_keys = ref_keys[:n]
+
+            # Last sample of each target at or before each reference sample
+            columns = [ref_data[:n]]
+            for k in range(1, len(self.acquisitions)):
+                keys, data, host_ns, exectimes = self.pending[k]
+                if len(keys) == 0:
+                    columns.append(np.full((n, data.shape[1]), np.nan, dtype=np.float32))
+                    continue
+                idx = np.searchsorted(keys, merge_keys, side="right") - 1
+                held = np.maximum(idx, 0)
+                vals = data[held]
+                vals[(idx < 0) | (merge_keys - keys[held] > self.tolerance)] = np.nan
+                columns.append(vals)
+
+                # Keep the last sample used, it may be held for the next reference samples
+                self.pending[k] = tuple(array[held[-1]:] for array in self.pending[k])
+            self.pending[0] = tuple(array[n:] for array in self.pending[0])
+
+            self.append_block(np.hstack(columns), ref_exectimes[:n], ref_host_ns[:n])
+            return n
@@ -0,0 +1,106 @@
+import threading, time
+import numpy as np
+
+class Histogram:
+
+    def __init__(self, min_ns: float = 1e3, max_ns: float = 1e10, bins_per_decade: int = 10):
+        # Log-spaced bins from min_ns to max_ns, plus underflow and overflow bins
+        self.edges = np.logspace(np.log10(min_ns), np.log10(max_ns), int(np.log10(max_ns/min_ns)*bins_per_decade) + 1)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.max = 0
+        self.sum = 0.0 # Whole session, never reset
+        self.sumsq = 0.0
+        self.reset_interval()
+
+    def reset_interval(self):
+        # Statistics since the last interval reset
+        self.interval_count = 0
+        self.interval_sum = 0.0
+        self.interval_sumsq = 0.0
+
+    def add(self, values_ns):
+        values_ns = np.asarray(values_ns, dtype=np.float64).ravel()
+        if len(values_ns) == 0:
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, values_ns), minlength=len(self.counts))
+        self.max = max(self.max, float(values_ns.max()))
+        total = float(values_ns.sum())
+        sumsq = float(np.dot(values_ns, values_ns))
+        self.sum = self.sum + total
+        self.sumsq = self.sumsq + sumsq
+        self.interval_count = self.interval_count + len(values_ns)
+        self.interval_sum = self.interval_sum + total
+        self.interval_sumsq = self.interval_sumsq + sumsq
+
+    def percentile(self, q: float):
+        # Upper edge of the bin holding the q-th percentile, in ns
+        total = self.counts.sum()
+        if total == 0:
+            return 0.0
+        idx = int(np.searchsorted(np.cumsum(self.counts), q/100*total))
+        return float(self.edges[min(idx, len(self.edges) - 1)])
+
+    def summary(self, interval: bool = True):
+        # Values in us, mean and std since the last interval reset or over the whole session
+        count = int(self.counts.sum())
+        if interval:
+            n, total, sumsq = self.interval_count, self.interval_sum, self.interval_sumsq
+        else:
+            n, total, sumsq = count, self.sum, self.sumsq
+        mean = total/n if n > 0 else 0.0
+        var = sumsq/n - mean**2 if n > 0 else 0.0
+        return {
+            "count": count,
+            "mean_us": mean/1e3,
+            "std_us": np.sqrt(max(var, 0.0))/1e3,
+            "p50_us": self.percentile(50)/1e3,
+            "p99_us": self.percentile(99)/1e3,
+            "max_us": self.max/1e3,
+        }
+
+    def to_dict(self):
+        # Whole session with the bins, for the saved metrics
+        summary = self.summary(interval=False)
+        summary["edges_us"] = (self.edges/1e3).tolist()
+        summary["counts"] = self.counts.tolist()
+        return summary
+
+class Metrics:
+
+    def __init__(self):
+        # Counters and histograms, updated from any thread
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_counters = {}
+        self.start_time = time.perf_counter_ns()
+        self.last_time = self.start_time
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, key: str, values_ns):
+        with self.lock:
+            if not(key in self.histograms):
+                self.histograms[key] = Histogram()
+            self.histograms[key].add(values_ns)
+
+    def snapshot(self, full: bool = False):
+        # Totals, rates per second and histogram summaries since the previous snapshot,
+        # or with full over the whole session with the histogram bins, leaving the interval untouched
+        with self.lock:
+            now = time.perf_counter_ns()
+            if full:
+                elapsed = max(now - self.start_time, 1)/1e9
+                rates = {key: value/elapsed for key, value in self.counters.items()}
+                histograms = {key: histogram.to_dict() for key, histogram in self.histograms.items()}
+                return {"counters": dict(self.counters), "rates": rates, "histograms": histograms}
+            elapsed = max(now - self.last_time, 1)/1e9
+            rates = {key: (value - self.last_counters.get(key, 0))/elapsed for key, value in self.counters.items()}
+            histograms = {key: histogram.summary() for key, histogram in self.histograms.items()}
+            for histogram in self.histograms.values():
+                histogram.reset_interval()
+            self.last_counters = dict(self.counters)
+            self.last_time = now
+            return {"counters": dict(self.counters), "rates": rates, "histograms": histograms}
@@ -0,0 +1,194 @@
+import argparse, collections, json, os, socket, struct, sys, threading, time
+import numpy as np
+import logwriter
+from metrics import Metrics
+
+# Live samples for other programs, on a local TCP or Unix socket
+# Each message is a type byte and a uint32 length, followed by:
+#   b'H': JSON header with the signal names and the record size, sent on connect and at each new session
+#   b'D': records with the layout of the .sbblog files (sample index, host time, exec time, signal values)
+message_prefix = struct.Struct('<cI')
+
+def parse_address(address: str):
+    # host:port for TCP, a path for a Unix socket
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return socket.AF_INET, (host, int(port))
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError(f"Unix sockets are not available, use host:port instead of {address}")
+    return socket.AF_UNIX, address
+
+class Client:
+
+    def __init__(self, conn, queue_size: int):
+        # Messages waiting to be sent, the oldest are dropped when the client is too slow
+        self.conn = conn
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.ready = threading.Condition()
+        self.connected = True
+
+class Publisher:
+
+    def __init__(self, address: str, queue_size: int = 256):
+        # Broadcasts the acquired blocks to every connected client, never blocking the acquisition
+        self.address = address
+        self.queue_size = queue_size # Messages queued per client
+        self.header = None # Last header message, sent to the new clients
+        self.dtype = None
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.metrics = Metrics() # Clients, messages sent and dropped
+        family, self.bind_address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(address): # Left over by a previous run
+            os.unlink(address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.bind_address)
+        self.server.listen()
+        self.running = True
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+
+    def accept(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError as e: # Closed
+                break
+            if conn.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = Client(conn, self.queue_size)
+            with self.clients_lock:
+                if not(self.header is None):
+                    client.queue.append(self.header)
+                self.clients.append(client)
+            self.metrics.count("connects")
+            threading.Thread(target=self.send, args=(client,), daemon=True).start()
+
+    def send(self, client):
+        # Sender thread of a client, a slow client only slows down itself
+        while client.connected:
+            with client.ready:
+                while len(client.queue) == 0 and client.connected:
+                    client.ready.wait()
+                messages = list(client.queue)
+                client.queue.clear()
+            try:
+                data = b''.join(messages)
+                client.conn.sendall(data)
+                self.metrics.count("bytes_sent", len(data))
+            except OSError as e:
+                break
+        self.disconnect(client)
+
+    def disconnect(self, client):
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+                self.metrics.count("disconnects")
+        with client.ready:
+            client.connected = False
+            client.ready.notify()
+        try: # Also wakes up a sender blocked in sendall
+            client.conn.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            pass
+        client.conn.close()
+
+    def broadcast(self, message: bytes):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            with client.ready:
+                if message[:1] == b'H': # Blocks of the previous session are of no use
+                    client.queue.clear()
+                elif len(client.queue) >= client.queue_size: # The oldest block makes room, never the header
+                    oldest = 1 if client.queue[0][:1] == b'H' else 0
+                    if oldest < len(client.queue):
+                        del client.queue[oldest]
+                        self.metrics.count("dropped")
+                client.queue.append(message)
+                client.ready.notify()
+
+    def start_session(self, signal_names):
+        # Header of the blocks published from now on
+        self.dtype = logwriter.record_dtype(len(signal_names))
+        header = json.dumps({"signal_names": list(signal_names), "record_size": self.dtype.itemsize}).encode("utf-8")
+        self.header = message_prefix.pack(b'H', len(header)) + header
+        self.broadcast(self.header)
+
+    def publish(self, first_index: int, exectimes, block, host_ns):
+        # Same arguments as LogWriter.write, the block is encoded once for all the clients
+        if len(self.clients) == 0 or self.dtype is None:
+            return
+        records = np.empty(len(block), dtype=self.dtype)
+        records["sample"] = np.arange(first_index, first_index + len(block))
+        records["host_ns"] = host_ns
+        records["time"] = exectimes
+        records["data"] = block
+        data = records.tobytes()
+        self.broadcast(message_prefix.pack(b'D', len(data)) + data)
+        self.metrics.count("blocks")
+
+    def close(self):
+        self.running = False
+        try: # Wakes up the accept thread
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            pass
+        self.server.close()
+        self.thread.join()
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            self.disconnect(client)
+        if self.server.family != socket.AF_INET and os.path.exists(self.address):
+            os.unlink(self.address)
+
+def connect(address: str):
+    # Socket of a client of the publisher at address
+    family, bind_address = parse_address(address)
+    conn = socket.socket(family, socket.SOCK_STREAM)
+    conn.connect(bind_address)
+    return conn
+
+def receive(conn):
+    # Generator of ("header", dict) and ("data", records) messages, until the publisher closes
+    reader = conn.makefile("rb")
+    dtype = None
+    while True:
+        prefix = reader.read(message_prefix.size)
+        if len(prefix) < message_prefix.size:
+            return
+        kind, length = message_prefix.unpack(prefix)
+        payload = reader.read(length)
+        if len(payload) < length:
+            return
+        if kind == b'H':
+            header = json.loads(payload.decode("utf-8"))
+            dtype = logwriter.record_dtype(len(header["signal_names"]))
+            yield "header", header
+        elif kind == b'D' and not(dtype is None):
+            yield "data", np.frombuffer(payload, dtype=dtype)
+
+if __name__ == "__main__":
+    # Example client, prints the sample rate and the last values
+    parser = argparse.ArgumentParser(description="Client of the SBB live sample publisher")
+    parser.add_argument("address", help="host:port or socket path, as address in the publish section of settings.json")
+    args = parser.parse_args()
+
+    samples = 0
+    last_print = time.perf_counter()
+    for kind, message in receive(connect(args.address)):
+        if kind == "header":
+            names = message["signal_names"]
+            print(f"Session with {len(names)} signals: {', '.join(names[:8])}{'...' if len(names) > 8 else ''}", file=sys.stderr)
+            continue
+        samples = samples + len(message)
+        now = time.perf_counter()
+        if now - last_print >= 1.0:
+            print(f"\rSample {message['sample'][-1]}  Rate: {samples/(now - last_print):.0f} S/s  Values: {np.array2string(message['data'][-1][:4], precision=3)}", end="", file=sys.stderr, flush=True)
+            samples = 0
+            last_print = now
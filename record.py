@@ -0,0 +1,158 @@
+import argparse, json, os, signal, sys, threading, time
+import serial
+import sbbtarget, logwriter, trigger, publisher
+from samplestore import SampleStore
+from acquisition import collect_metrics
+from merge import create_acquisition, merged_names
+
+# Headless recording, without Qt: acquire from the targets and stream the log to file
+
+def close_all(targets):
+    for target in targets:
+        target.close()
+
+def record(settings, ports, duration: float = 0, log_file: str = "", quiet: bool = False, signals=None, trigger_mode="off", trigger_signal="", trigger_level=0.0, publish_address=""):
+    # Returns 0 on success, 1 when the communication could not be opened or was lost
+    # With several ports, the targets are acquired concurrently and merged into one log
+    # With a trigger, only the windows around the trigger events are logged
+    # With a publish address, the samples are also broadcast to the clients connected there
+    comm = settings["comm"]
+    targets = []
+    for port in ports:
+        target = sbbtarget.SBBTarget()
+        target.port = port
+        target.baudrate = int(comm["baud_def"])
+        target.timeout = comm["timeout_def"]/1000.0
+        try:
+            target.open()
+        except serial.SerialException as e:
+            print(f"Failed to open {port}: {e}", file=sys.stderr)
+            close_all(targets)
+            return 1
+        targets.append(target)
+    target_signal_names = [target.get_signames() for target in targets]
+    if any(len(names) == 0 for names in target_signal_names):
+        print("No signal names received from the target", file=sys.stderr)
+        close_all(targets)
+        return 1
+    signal_names = target_signal_names[0] if len(targets) == 1 else merged_names(ports, target_signal_names)
+
+    # Subscribe to the given signals only
+    channels = None
+    if signals:
+        unknown = [name for name in signals if not(name in signal_names)]
+        if len(unknown) > 0:
+            print(f"Unknown signals: {', '.join(unknown)}", file=sys.stderr)
+            close_all(targets)
+            return 1
+        if len(targets) > 1:
+            print("Signal subscription needs a single target", file=sys.stderr)
+            close_all(targets)
+            return 1
+        channels = sorted(signal_names.index(name) for name in signals)
+
+    # Trigger on a recorded signal
+    recorded_names = signal_names if channels is None else [signal_names[signal_id] for signal_id in channels]
+    capture = None
+    if trigger_mode != "off":
+        if trigger_mode == "manual" or not(trigger_signal in recorded_names):
+            print(f"Trigger {trigger_mode} needs one of the recorded signals", file=sys.stderr)
+            close_all(targets)
+            return 1
+        triggers = [trigger.Trigger(trigger_mode, recorded_names.index(trigger_signal), trigger_level, f"{trigger_mode}({trigger_signal})")]
+        capture = trigger.Capture(triggers, len(recorded_names), settings["trigger"]["pre"], settings["trigger"]["post"])
+
+    # Log file and a small store, nothing is plotted
+    if not log_file:
+        os.makedirs(settings["gui"]["log_dir"], exist_ok=True)
+        log_file = os.path.join(settings["gui"]["log_dir"], time.strftime("sbblog_%Y%m%d_%H%M%S.sbblog"))
+    log_writer = logwriter.LogWriter(log_file, recorded_names)
+    store = SampleStore(max(comm["stream_buffer"], 1), len(recorded_names))
+    acquisition = create_acquisition(targets, target_signal_names, signal_names, store, comm, False, log_writer, channels)
+    acquisition.capture = capture
+    live = None
+    if publish_address:
+        try:
+            live = publisher.Publisher(publish_address, settings["publish"]["queue_size"])
+        except (OSError, ValueError) as e:
+            print(f"Failed to publish on {publish_address}: {e}", file=sys.stderr)
+            close_all(targets)
+            log_writer.close()
+            return 1
+        live.start_session(acquisition.signal_names)
+        acquisition.publisher = live
+    lost = threading.Event()
+    acquisition.on_error = lost.set
+    if not quiet:
+        acquisition.on_reconnect = lambda reconnecting: print("\nCommunication lost, reconnecting..." if reconnecting else "\nReconnected", file=sys.stderr)
+
+    # Ctrl+C stops the recording
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    if not quiet:
+        print(f"Recording {len(recorded_names)} signals from {', '.join(ports)} to {log_file}", file=sys.stderr)
+    start = time.perf_counter()
+    if not acquisition.start():
+        lost.set()
+    status_time = settings["gui"]["metrics_time"]/1000.0
+    while not stop.is_set() and not lost.is_set():
+        if duration > 0 and time.perf_counter() - start >= duration:
+            break
+        stop.wait(status_time if duration <= 0 else min(status_time, max(duration - (time.perf_counter() - start), 0.001)))
+        if not quiet:
+            rates = acquisition.metrics.snapshot()["rates"]
+            print(f"\rSamples: {acquisition.count}  Rate: {rates.get('samples', 0):.0f} S/s  Exec time: {acquisition.exectime:.2f} s  Dropped: {sum(target.stream_dropped for target in targets)}  Lost: {sum(target.frames_lost for target in targets)}" + ("" if capture is None else f"  Captures: {len(capture.captures)}"), end="", file=sys.stderr, flush=True)
+
+    acquisition.stop()
+    log_writer.close()
+    if not(live is None):
+        live.close()
+    close_all(targets)
+    if not quiet:
+        print("", file=sys.stderr)
+
+    # Metrics next to the log file, as in the GUI
+    with open(os.path.splitext(log_file)[0] + "_metrics.json", "w") as file:
+        metrics = collect_metrics(targets, acquisition, capture, live, full=True)
+        json.dump(metrics, file, indent=1)
+    if lost.is_set():
+        print("Communication lost", file=sys.stderr)
+        return 1
+    if not quiet:
+        if capture is None:
+            print(f"{acquisition.count} samples written to {log_file}", file=sys.stderr)
+        else:
+            print(f"{len(capture.captures)} captures of {acquisition.count} samples written to {log_file}", file=sys.stderr)
+    return 0
+
+def add_arguments(parser):
+    parser.add_argument("--port", help="serial port of the target, overrides port_def in settings.json")
+    parser.add_argument("--duration", type=float, default=0, help="recording duration in s (default: until Ctrl+C)")
+    parser.add_argument("--output", default="", help="log file (default: a timestamped .sbblog file in log_dir)")
+    parser.add_argument("--signals", nargs="+", help="names of the signals to record, subscribed to on the target (default: all)")
+    parser.add_argument("--trigger", choices=[kind for kind in trigger.kinds if kind != "manual"], help="log only around the trigger events (default: mode in settings.json)")
+    parser.add_argument("--trigger-signal", help="signal the trigger fires on (default: signal in settings.json)")
+    parser.add_argument("--trigger-level", type=float, help="trigger level, or rate limit per second (default: level in settings.json)")
+    parser.add_argument("--publish", help="also broadcast the samples on this host:port or socket path (default: address in settings.json)")
+    parser.add_argument("--quiet", action="store_true", help="do not print the progress")
+
+def main(args):
+    with open("settings.json", "r") as file:
+        settings = json.load(file)
+    port = args.port or settings["comm"].get("port_def", "")
+    if not port:
+        print("No port given, use --port or set port_def in settings.json", file=sys.stderr)
+        return 1
+    trigger_mode = args.trigger or settings["trigger"]["mode"]
+    trigger_signal = args.trigger_signal or settings["trigger"]["signal"]
+    trigger_level = settings["trigger"]["level"] if args.trigger_level is None else args.trigger_level
+    publish_address = settings["publish"]["address"] if args.publish is None else args.publish
+    return record(settings, [port] + settings["comm"]["extra_ports"], args.duration, args.output, args.quiet, args.signals, trigger_mode, trigger_signal, trigger_level, publish_address)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless SBB recording")
+    add_arguments(parser)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+import os, threading, time
+import numpy as np
+import logwriter
+from acquisition import Acquisition
+
+formats = {".sbblog": "SBB log file (*.sbblog)", ".mat": "MAT file (*.mat)", ".npz": "NumPy archive (*.npz)", ".npy": "NumPy array (*.npy)"}
+info_columns = ("sample", "time", "host_ns") # Logged columns that are not signals
+
+class LogSource:
+
+    def __init__(self, filename: str, sample_time: float = 1.0):
+        # Saved log read in chunks, .sbblog and .npy files are memory-mapped and read from disk as
+        # the replay goes, .npz and .mat files are loaded into memory on open
+        self.filename = filename
+        ext = os.path.splitext(filename)[1].lower()
+        self.data = None # (n, num_sig) records of a .sbblog file
+        self.columns = [] # One array per signal otherwise
+        if ext == ".sbblog":
+            header, records = logwriter.open_log(filename)
+            self.signal_names = header["signal_names"]
+            self.data = records["data"]
+            self.exectimes = records["time"]
+            self.host_ns = records["host_ns"] if "host_ns" in records.dtype.names else None
+            self.length = len(records)
+        else:
+            if ext == ".npy": # Structured array with one field per column
+                array = np.load(filename, mmap_mode="r")
+                columns = {name: array[name] for name in array.dtype.names}
+            elif ext == ".npz":
+                columns = np.load(filename)
+            elif ext == ".mat":
+                from scipy.io import loadmat
+                columns = {key: value.ravel() for key, value in loadmat(filename).items() if not key.startswith("__")}
+            else:
+                raise ValueError(f"Unknown log format {ext}")
+            self.signal_names = [name for name in columns.keys() if not(name in info_columns)]
+            self.columns = [columns[name] for name in self.signal_names]
+            self.exectimes = columns["time"] if "time" in columns else None
+            self.host_ns = columns["host_ns"] if "host_ns" in columns else None
+            self.length = len(self.columns[0]) if len(self.columns) > 0 else 0
+
+        # Replay timeline in ns: host times if logged, otherwise exec times, otherwise one sample every sample_time ms
+        if not(self.host_ns is None) and self.length > 0 and self.host_ns[-1] > 0:
+            self.times = self.host_ns
+        elif not(self.exectimes is None) and self.length > 0 and not np.isnan(self.exectimes[-1]):
+            self.times = (np.asarray(self.exectimes, dtype=np.float64)*1e9).astype(np.int64)
+        else:
+            self.times = np.arange(self.length, dtype=np.int64)*int(sample_time*1e6)
+
+    def read(self, start: int, stop: int):
+        # Returns the (n, num_sig) block, the exec times and the host times of the samples [start, stop)
+        if self.data is None:
+            block = np.column_stack([column[start:stop] for column in self.columns]).astype(np.float32)
+        else:
+            block = np.array(self.data[start:stop], dtype=np.float32)
+        if self.exectimes is None:
+            exectimes = np.full(stop - start, np.nan, dtype=np.float32)
+        else:
+            exectimes = np.asarray(self.exectimes[start:stop], dtype=np.float32)
+        host_ns = np.asarray(self.times[start:stop], dtype=np.int64)
+        return block, exectimes, host_ns
+
+class Replay(Acquisition):
+
+    def __init__(self, source, store, speed: float = 1.0, block_size: int = 1000, enable_log=False, log_writer=None, max_gap: float = 1.0):
+        # Feeds a saved log to the store as a live acquisition would, at speed times real time (0 for as fast as possible)
+        super().__init__(None, source.signal_names, store, enable_log=enable_log, log_writer=log_writer)
+        self.source = source
+        self.speed = speed
+        self.block_size = block_size # Maximum samples per block
+        self.max_gap = max_gap # Longer waits (s), e.g. between the windows of a triggered log, are skipped
+        self.position = 0 # Next sample to replay
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if not(self.thread is None) and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def run(self):
+        start_ns = time.perf_counter_ns()
+        first_time = int(self.source.times[0]) if self.source.length > 0 else 0
+        while self.running and self.position < self.source.length:
+            stop = min(self.position + self.block_size, self.source.length)
+            if self.speed > 0: # Samples due by now on the log timeline
+                now = first_time + int((time.perf_counter_ns() - start_ns)*self.speed)
+                stop = min(stop, int(np.searchsorted(self.source.times, now, side="right")))
+                if stop <= self.position: # Wait for the next sample
+                    wait = (int(self.source.times[self.position]) - now)/self.speed/1e9
+                    if wait > self.max_gap: # Move the timeline to the next sample
+                        start_ns = start_ns - int(wait*1e9)
+                        continue
+                    time.sleep(min(max(wait, 0), 0.01))
+                    continue
+
+            process_start = time.perf_counter_ns()
+            block, exectimes, host_ns = self.source.read(self.position, stop)
+            self.append_block(block, exectimes, host_ns)
+            self.position = stop
+            self.metrics.observe("process", time.perf_counter_ns() - process_start)
+
+        # End of the log
+        if self.running:
+            self.running = False
+            if not(self.on_end is None):
+                self.on_end()
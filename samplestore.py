@@ -0,0 +1,133 @@
+import threading
+import numpy as np
+from history import History
+
+class SampleStore:
+
+    def __init__(self, capacity: int, num_sig: int, block_size: int = 32, history_bucket: int = 0):
+        self.capacity = capacity
+        self.num_sig = num_sig
+        self.count = 0 # Total number of samples appended
+        self.lock = threading.Lock() # Held while writing or reading views
+
+        # Every sample is written twice, at i and i + capacity, so that the
+        # last capacity samples are always a contiguous slice
+        self.data = np.zeros((2*capacity, num_sig), dtype=np.float32)
+        self.index = np.zeros(2*capacity, dtype=np.int64)
+        self.host_ns = np.zeros(2*capacity, dtype=np.int64) # Host arrival time (perf_counter_ns)
+        self.exectimes = np.full(2*capacity, np.nan, dtype=np.float32) # Exec time of the target
+
+        # Min and max of each signal over blocks of block_size samples, block k
+        # covers the sample indexes [k*block_size, (k+1)*block_size)
+        self.block_size = block_size
+        self.num_blocks = capacity // block_size + 2
+        self.block_min = np.zeros((self.num_blocks, num_sig), dtype=np.float32)
+        self.block_max = np.zeros((self.num_blocks, num_sig), dtype=np.float32)
+        self.block_last = -1 # Last block written
+
+        # Min/max pyramid of the whole session, for the samples no longer in the buffer
+        self.history = History(num_sig, history_bucket) if history_bucket > 0 else None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, block, first_index: int, host_ns, exectimes=None):
+        # Append an (n, num_sig) block whose first sample has index first_index
+        n = len(block)
+        if n == 0:
+            return
+        index = np.arange(first_index, first_index + n, dtype=np.int64)
+        if exectimes is None:
+            exectimes = np.full(n, np.nan, dtype=np.float32)
+        history_block = block
+        if n > self.capacity: # Only the newest samples fit
+            block = block[-self.capacity:]
+            index = index[-self.capacity:]
+            host_ns = host_ns[-self.capacity:]
+            exectimes = exectimes[-self.capacity:]
+            skipped = n - self.capacity
+        else:
+            skipped = 0
+
+        with self.lock:
+            pos = (self.count + skipped) % self.capacity
+            m = len(block)
+            head = min(m, self.capacity - pos) # Samples before wrapping around
+            for offset in (0, self.capacity):
+                self.data[offset + pos:offset + pos + head] = block[:head]
+                self.index[offset + pos:offset + pos + head] = index[:head]
+                self.host_ns[offset + pos:offset + pos + head] = host_ns[:head]
+                self.exectimes[offset + pos:offset + pos + head] = exectimes[:head]
+                self.data[offset:offset + m - head] = block[head:]
+                self.index[offset:offset + m - head] = index[head:]
+                self.host_ns[offset:offset + m - head] = host_ns[head:]
+                self.exectimes[offset:offset + m - head] = exectimes[head:]
+            self.update_blocks(block, index[0])
+            if not(self.history is None):
+                self.history.append(history_block, first_index)
+            self.count = self.count + n
+
+    def update_blocks(self, block, first_index: int):
+        # Reduce the new samples at the block boundaries, NaNs are ignored
+        first_block = first_index // self.block_size
+        last_block = (first_index + len(block) - 1) // self.block_size
+        blocks = np.arange(first_block, last_block + 1)
+        starts = blocks*self.block_size - first_index
+        starts[0] = 0
+        block_min = np.fmin.reduceat(block, starts, axis=0)
+        block_max = np.fmax.reduceat(block, starts, axis=0)
+
+        # The first block may continue the one written by the previous append
+        rows = blocks % self.num_blocks
+        if first_block == self.block_last:
+            block_min[0] = np.fmin(block_min[0], self.block_min[rows[0]])
+            block_max[0] = np.fmax(block_max[0], self.block_max[rows[0]])
+        self.block_min[rows] = block_min
+        self.block_max[rows] = block_max
+        self.block_last = last_block
+
+    def last(self, n: int):
+        # Zero-copy views of the last n samples, returns (index, data)
+        # The views are overwritten by later appends, read them holding lock
+        n = min(n, len(self))
+        end = (self.count - 1) % self.capacity + 1 + self.capacity
+        return self.index[end - n:end], self.data[end - n:end]
+
+    def last_host_ns(self, n: int):
+        # Zero-copy view of the host times of the last n samples
+        n = min(n, len(self))
+        end = (self.count - 1) % self.capacity + 1 + self.capacity
+        return self.host_ns[end - n:end]
+
+    def since(self, first_index: int):
+        # Copies of the samples from first_index on still in the buffer, read holding lock
+        # Returns (index, data, host times, exec times)
+        n = max(min(self.count - first_index, len(self)), 0)
+        end = (self.count - 1) % self.capacity + 1 + self.capacity
+        return self.index[end - n:end].copy(), self.data[end - n:end].copy(), self.host_ns[end - n:end].copy(), self.exectimes[end - n:end].copy()
+
+    def extrema(self, columns, n: int):
+        # Min and max of the given columns over the last n samples, read holding lock
+        # Complete blocks come from the block extrema, only the partial ones at the edges are scanned
+        n = min(n, len(self))
+        if n == 0 or len(columns) == 0:
+            return None, None
+        start = self.count - n
+        first_full = -(-start // self.block_size)
+        last_full = self.count // self.block_size
+        _, data = self.last(n)
+        if first_full >= last_full: # Window within a block or two
+            parts_min = [data[:, columns]]
+            parts_max = parts_min
+        else:
+            rows = np.arange(first_full, last_full) % self.num_blocks
+            head = data[:first_full*self.block_size - start, columns]
+            tail = data[last_full*self.block_size - start:, columns]
+            parts_min = [self.block_min[rows][:, columns], head, tail]
+            parts_max = [self.block_max[rows][:, columns], head, tail]
+        # fmin/fmax skip the NaNs, empty edges are skipped as they have no identity
+        min_value = np.fmin.reduce([np.fmin.reduce(part, axis=None) for part in parts_min if part.size > 0])
+        max_value = np.fmax.reduce([np.fmax.reduce(part, axis=None) for part in parts_max if part.size > 0])
+        if np.isnan(min_value): # Only NaNs
+            return None, None
+        return float(min_value), float(max_value)
@@ -1,42 +1,82 @@
 # PySide modules
 from PySide6.QtWidgets import QApplication, QComboBox, QCheckBox, QListView, QMainWindow, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QListWidget, QAbstractItemView, QLineEdit, QFileDialog, QProgressDialog
-from PySide6.QtGui import QPainter, QStandardItemModel, QStandardItem
-from PySide6 import QtCharts
-from PySide6.QtCore import QTimer, Qt, QThread, QObject, Signal, Slot
+from PySide6.QtGui import QPainter
+from PySide6.QtCore import QTimer, Qt, QThread, QObject, QEvent, Signal, Slot, QStringListModel, QSortFilterProxyModel, QItemSelection, QItemSelectionModel
 
 # SBB modules
 import serial.tools.list_ports
 import sbbtarget
+from samplestore import SampleStore
+from acquisition import collect_metrics
+from merge import create_acquisition, merged_names
 
 # Other modules
-import json, utils
-from scipy.io import savemat
+import json, os, time, utils, decimate, derived, logwriter, logexport, replay, trigger, publisher
+from metrics import Metrics
+import numpy as np
+
+QtCharts = None # Imported once the window is shown
 
 class SBBPyGui(QMainWindow):
 
     def __init__(self):
         super().__init__()
+        phase_start = time.perf_counter()
+        self.startup_times = {} # Duration of each startup phase in s
 
-        self.signal_series_dict = {}  # Dictionary to store signal series
+        self.signal_series_dict = {}  # Series of the selected signals, created on selection
+        self.selected_names = set() # Selected signals and derived channels, including those filtered out of the list
+        self.signal_ids = {} # Id of each signal name
+        self.filtering = False # Signal list filter being applied
         self.signal_names = []  # List to store signal names
         self.comm_status_str = "" # Status of the communication
         self.target = sbbtarget.SBBTarget()
+        self.targets = [self.target] # The first target plus those on extra_ports
+        self.target_signal_names = [] # Signal names of each target
         self.isrunning = False
         self.loggeddata = {}
+        self.store = None # Sample store shared with the Executer
+        self.channels = [] # Signal ids of the store columns
+        self.channel_columns = {} # Store column of each signal id
+        self.derived = {} # Kind and signal id of each derived channel, by name
+        self.derived_range = None # Min and max of the visible derived channels in the last update
+        self.session_view = False # Whole session shown from the history, following its growth
+        self.panned = False # X range set with the wheel or by panning
+        self.pan_x = 0 # Last cursor position while panning
+        self.log_writer = None # Writer of the log file during the execution
+        self.log_file = "" # Last log file written
+        self.capture = None # Triggered capture of the log during the execution
+        self.publisher = None # Live samples for other programs, with an address in the publish settings
+        self.render_metrics = Metrics() # Chart frame times
+        self.session_metrics = {} # Metrics of the last execution
 
         self.settings = {}
 
         self.load_settings()
+        self.startup_times["settings"] = time.perf_counter() - phase_start
 
+        phase_start = time.perf_counter()
         self.init_ui()
+        self.start_publisher()
+        self.startup_times["init_ui"] = time.perf_counter() - phase_start
 
-        self.update_signal_list()
+        # The chart is built once the window is shown, the signal series once the communication is open
+        QTimer.singleShot(0, self.init_chart)
 
     def load_settings(self):
         # Load settings from JSON file
         with open("settings.json", "r") as file:
             self.settings = json.load(file)
 
+    def start_publisher(self):
+        # Listens for the whole life of the window, the clients stay connected between executions
+        if not self.settings["publish"]["address"]:
+            return
+        try:
+            self.publisher = publisher.Publisher(self.settings["publish"]["address"], self.settings["publish"]["queue_size"])
+        except (OSError, ValueError) as e:
+            self.statusBar().showMessage(f"Publisher not started: {e}")
+
     def init_ui(self):
         self.setWindowTitle("SLRT-Host")
         self.setGeometry(self.settings["gui"]["win_defsize"][0], self.settings["gui"]["win_defsize"][1], self.settings["gui"]["win_defsize"][2], self.settings["gui"]["win_defsize"][3])
@@ -50,7 +90,8 @@ class SBBPyGui(QMainWindow):
         self.port_input.setMaximumWidth(self.settings["gui"]["port_maxwidth"])
         self.port_input.setMinimumWidth(self.settings["gui"]["port_minwidth"])
         self.port_input.addItem("Refresh", -1)
-        self.update_port_list(None)
+        self.port_thread = None
+        self.update_port_list(None) # Enumerated on a separate thread
         self.port_input.view().pressed.connect(self.update_port_list)
 
         self.baud_label = QLabel("Baudrate:")
@@ -76,47 +117,75 @@ class SBBPyGui(QMainWindow):
         self.execution_button.setDisabled(True) # Initially disabled
         self.execution_button.clicked.connect(self.toggle_execution)
         self.execution_time_display = QLabel("Execution Time: 0.00")
-        self.update_timer = QTimer()
-        self.update_timer.setInterval(self.settings["gui"]["update_time"])
+        self.metrics_timer = QTimer()
+        self.metrics_timer.setInterval(self.settings["gui"]["metrics_time"])
+        self.metrics_timer.timeout.connect(self.update_metrics)
+
+        # The chart pulls the new samples from the store on its own timer, whatever the sample rate
+        self.render_timer = QTimer()
+        self.render_timer.setInterval(self.settings["gui"]["update_time"])
+        self.render_timer.timeout.connect(self.render)
+        self.rendered_count = 0 # Store count at the last render
 
         # Logdata widgets
         self.enable_log_checkbox = QCheckBox("Log data")
         self.save_log_button = QPushButton("Save log")
         self.save_log_button.clicked.connect(self.save_log)
 
+        # Replay widgets
+        self.replay_button = QPushButton("Replay log")
+        self.replay_button.clicked.connect(self.replay_log)
+        self.replay_speed_input = QComboBox()
+        for speed in self.settings["gui"]["replay_speeds"]:
+            self.replay_speed_input.addItem(f"{speed:g}x" if speed > 0 else "Max", speed)
+
+        # Trigger widgets, only the windows around the trigger events are logged
+        self.trigger_input = QComboBox()
+        for kind, label in trigger.kinds.items():
+            self.trigger_input.addItem(label, kind)
+        self.trigger_input.setCurrentIndex(list(trigger.kinds).index(self.settings["trigger"]["mode"]))
+        self.trigger_level_input = QLineEdit(f"{self.settings['trigger']['level']:g}")
+        self.trigger_level_input.setMaximumWidth(self.settings["gui"]["trigger_maxwidth"])
+        self.trigger_level_input.setMinimumWidth(self.settings["gui"]["trigger_minwidth"])
+        self.trigger_level_input.setToolTip("Trigger level, or rate limit per second")
+        self.trigger_button = QPushButton("Trigger")
+        self.trigger_button.setDisabled(True) # Enabled while capturing
+        self.trigger_button.clicked.connect(self.fire_trigger)
+
+        # Chart widgets
+        self.reset_zoom_button = QPushButton("Reset zoom")
+        self.reset_zoom_button.clicked.connect(self.reset_zoom)
+        self.session_button = QPushButton("Full session")
+        self.session_button.clicked.connect(self.show_session)
+
+        # Derived channel widgets
+        self.derived_input = QComboBox()
+        for kind, label in derived.kinds.items():
+            self.derived_input.addItem(label, kind)
+        self.add_derived_button = QPushButton("Add derived")
+        self.add_derived_button.clicked.connect(self.add_derived)
+        self.remove_derived_button = QPushButton("Remove derived")
+        self.remove_derived_button.clicked.connect(self.remove_derived)
+
         # Signal widgets
         self.signal_label = QLabel("Select Signal(s):")
+        self.signal_filter_input = QLineEdit()
+        self.signal_filter_input.setPlaceholderText("Filter")
+        self.signal_filter_input.setMaximumWidth(self.settings["gui"]["sgnlist_maxwidth"])
+        self.signal_filter_input.setMinimumWidth(self.settings["gui"]["sgnlist_minwidth"])
+        self.signal_filter_input.textChanged.connect(self.filter_signal_list)
         self.signal_list = QListView()
         self.signal_list.setMaximumWidth(self.settings["gui"]["sgnlist_maxwidth"])
         self.signal_list.setMinimumWidth(self.settings["gui"]["sgnlist_minwidth"])
         self.signal_list.setSelectionMode(QListView.ExtendedSelection)
         self.signal_list.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.signal_list_model = QStandardItemModel()
-        self.signal_list.setModel(self.signal_list_model)
-        self.signal_list.pressed.connect(self.update_series_visibility)
-
-        # Create the chart and set its properties
-        self.chart = QtCharts.QChart()
-        self.chart.setBackgroundRoundness(0)
-
-        # Create the X and Y axes for the chart
-        self.x_axis = QtCharts.QValueAxis()
-        self.y_axis = QtCharts.QValueAxis()
-        self.x_axis.setTitleText("Sample")
-        self.y_axis.setTitleText("Signal value(s)")
-
-        # Set the ranges for the X and Y axes
-        self.update_axis_range(0)
-
-        # Add the axes to the chart
-        self.chart.addAxis(self.x_axis, Qt.AlignBottom)
-        self.chart.addAxis(self.y_axis, Qt.AlignLeft)
-
-        # Create the chart view
-        self.chart_view = QtCharts.QChartView(self.chart)
-        self.chart_view.setRenderHint(QPainter.Antialiasing)
-        self.chart_view.setRubberBand(QtCharts.QChartView.RectangleRubberBand)
-        self.chart_view.setDragMode(QtCharts.QChartView.ScrollHandDrag)
+        self.signal_list.setUniformItemSizes(True) # Only the visible rows are laid out
+        self.signal_list_model = QStringListModel() # Names only, no item per signal
+        self.signal_list_proxy = QSortFilterProxyModel()
+        self.signal_list_proxy.setSourceModel(self.signal_list_model)
+        self.signal_list_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.signal_list.setModel(self.signal_list_proxy)
+        self.signal_list.selectionModel().selectionChanged.connect(self.on_signal_selection_changed)
 
         # Communication and Execution layouts
         comm_exec_layout = QHBoxLayout()
@@ -135,18 +204,28 @@ class SBBPyGui(QMainWindow):
         logdata_layout = QHBoxLayout()
         logdata_layout.addWidget(self.enable_log_checkbox)
         logdata_layout.addWidget(self.save_log_button)
+        logdata_layout.addWidget(self.replay_button)
+        logdata_layout.addWidget(self.replay_speed_input)
+        logdata_layout.addWidget(self.trigger_input)
+        logdata_layout.addWidget(self.trigger_level_input)
+        logdata_layout.addWidget(self.trigger_button)
         logdata_layout.addStretch(1)
+        logdata_layout.addWidget(self.derived_input)
+        logdata_layout.addWidget(self.add_derived_button)
+        logdata_layout.addWidget(self.remove_derived_button)
+        logdata_layout.addWidget(self.session_button)
+        logdata_layout.addWidget(self.reset_zoom_button)
 
         # Signal and Chart layouts
         signal_chart_layout = QHBoxLayout()
         left_layout = QVBoxLayout()
         left_layout.addWidget(self.signal_label)
+        left_layout.addWidget(self.signal_filter_input)
         left_layout.addWidget(self.signal_list)
 
-        chart_layout = QVBoxLayout()
-        chart_layout.addWidget(self.chart_view)
+        self.chart_layout = QVBoxLayout() # Chart view added by init_chart
         signal_chart_layout.addLayout(left_layout)
-        signal_chart_layout.addLayout(chart_layout)
+        signal_chart_layout.addLayout(self.chart_layout, 1)
 
         # Bottom layout for Communication and Execution status labels
         bottom_layout = QHBoxLayout()
@@ -166,6 +245,52 @@ class SBBPyGui(QMainWindow):
         # Set a specific style for the application (e.g., "Fusion", "Windows", "Macintosh")
         self.setStyle("Fusion")  # Replace "Fusion" with the desired style name
 
+    def init_chart(self):
+        # Create the chart and set its properties
+        global QtCharts
+        phase_start = time.perf_counter()
+        from PySide6 import QtCharts
+        self.startup_times["import_qtcharts"] = time.perf_counter() - phase_start
+        self.chart = QtCharts.QChart()
+        self.chart.setBackgroundRoundness(0)
+
+        # Create the X and Y axes for the chart
+        self.x_axis = QtCharts.QValueAxis()
+        self.y_axis = QtCharts.QValueAxis()
+        self.x_axis.setTitleText("Sample")
+        self.y_axis.setTitleText("Signal value(s)")
+
+        # Set the ranges for the X and Y axes
+        self.update_axis_range(0)
+
+        # Add the axes to the chart
+        self.chart.addAxis(self.x_axis, Qt.AlignBottom)
+        self.chart.addAxis(self.y_axis, Qt.AlignLeft)
+        self.x_axis.rangeChanged.connect(self.on_x_range_changed)
+
+        # Create the chart view
+        self.chart_view = QtCharts.QChartView(self.chart)
+        self.chart_view.setRenderHint(QPainter.Antialiasing)
+        self.chart_view.setRubberBand(QtCharts.QChartView.RectangleRubberBand)
+        self.chart_view.setDragMode(QtCharts.QChartView.ScrollHandDrag)
+        self.chart_view.viewport().installEventFilter(self) # Wheel zoom and middle button panning
+        self.chart_layout.addWidget(self.chart_view)
+
+        # Spectrum chart, shown with the spectra of the derived channels
+        self.spectrum_chart = QtCharts.QChart()
+        self.spectrum_chart.setBackgroundRoundness(0)
+        self.freq_axis = QtCharts.QValueAxis()
+        self.psd_axis = QtCharts.QLogValueAxis()
+        self.freq_axis.setTitleText("Frequency (Hz)")
+        self.psd_axis.setTitleText("PSD")
+        self.spectrum_chart.addAxis(self.freq_axis, Qt.AlignBottom)
+        self.spectrum_chart.addAxis(self.psd_axis, Qt.AlignLeft)
+        self.spectrum_view = QtCharts.QChartView(self.spectrum_chart)
+        self.spectrum_view.setRenderHint(QPainter.Antialiasing)
+        self.spectrum_view.setVisible(False)
+        self.chart_layout.addWidget(self.spectrum_view)
+        self.startup_times["init_chart"] = time.perf_counter() - phase_start
+
     def setStyle(self, style):
         # Set a specific style for the application
         app = QApplication.instance()
@@ -177,9 +302,71 @@ class SBBPyGui(QMainWindow):
             return
         
         options = QFileDialog.Options()
-        filename, _ = QFileDialog.getSaveFileName(self, "Save MATLAB file", "", "MAT file (*.mat)", options=options)
-        if filename:
-            savemat(filename, {key.replace(' ', '_'): value for key, value in self.loggeddata.items()}, appendmat=True, oned_as='column', long_field_names=True)
+        filename, selected_filter = QFileDialog.getSaveFileName(self, "Save log file", "", ";;".join(logexport.formats.values()), options=options)
+        if not filename:
+            return
+        if not(os.path.splitext(filename)[1].lower() in logexport.formats): # Extension of the selected format
+            filename = filename + next(ext for ext, name in logexport.formats.items() if name == selected_filter)
+
+        # Export on a separate thread, showing the progress
+        self.save_log_button.setDisabled(True)
+        self.export_progress = QProgressDialog("Saving log...", "Cancel", 0, 100, self)
+        self.export_progress.setWindowModality(Qt.WindowModal)
+        self.export_progress.setMinimumDuration(500)
+        self.export_thread = QThread()
+        self.exporter = Exporter(self.loggeddata, filename)
+        self.exporter.moveToThread(self.export_thread)
+        self.exporter.progress.connect(self.export_progress.setValue)
+        self.exporter.finished.connect(self.on_save_log_finished)
+        self.export_progress.canceled.connect(self.exporter.cancel, Qt.DirectConnection)
+        self.export_thread.started.connect(self.exporter.export)
+        self.export_thread.start()
+
+    def on_save_log_finished(self, error):
+        self.export_thread.quit()
+        self.export_thread.wait()
+        self.export_progress.reset()
+        self.save_log_button.setDisabled(False)
+        if error:
+            self.execution_time_display.setText(f"Error: {error}")
+        else:
+            self.save_metrics(self.exporter.filename)
+
+    def save_metrics(self, filename):
+        # Metrics next to the log file, as <name>_metrics.json
+        with open(os.path.splitext(filename)[0] + "_metrics.json", "w") as file:
+            json.dump(self.session_metrics, file, indent=1)
+
+    def collect_metrics(self, full=False):
+        metrics = collect_metrics(self.targets, self.executer.acquisition, self.capture, self.publisher, full)
+        metrics["render"] = self.render_metrics.snapshot(full)
+        return metrics
+
+    def update_metrics(self):
+        # Summary of the last interval in the status bar
+        metrics = self.collect_metrics()
+        link = metrics["link"]
+        acquisition = metrics["acquisition"]
+        rtt = link["histograms"].get("rtt", {})
+        interval = acquisition["histograms"].get("interval", {})
+        process = acquisition["histograms"].get("process", {})
+        frame = metrics["render"]["histograms"].get("frame", {})
+        captures = f" | Captures: {len(metrics['captures'])}" if "captures" in metrics else ""
+        rtt_text = f" | RTT p50/p99: {rtt['p50_us']/1e3:.2f}/{rtt['p99_us']/1e3:.2f} ms" if rtt.get("count", 0) > 0 else "" # No requests in stream mode
+        self.statusBar().showMessage(
+            f"Rate: {acquisition['rates'].get('samples', 0):.0f} S/s"
+            f" | Jitter: {interval.get('std_us', 0):.0f} us"
+            f"{rtt_text}"
+            f" | Link: {link['rates'].get('bytes_read', 0)/1e3:.1f} kB/s"
+            f" | Short reads: {link['counters'].get('short_reads', 0)}"
+            f" | Timeouts: {link['counters'].get('timeouts', 0)}"
+            f" | Dropped: {link['counters'].get('dropped', 0)}"
+            f" | Lost: {link['counters'].get('lost_frames', 0)}"
+            f"{captures}"
+            f" | Process: {process.get('mean_us', 0):.0f} us"
+            f" | Frame: {frame.get('mean_us', 0)/1e3:.1f} ms"
+            f" @ {metrics['render']['rates'].get('frames', 0):.0f} fps"
+        )
             
     def validate_baud(self, baudstr):
         if utils.valid_baud(baudstr):
@@ -211,13 +398,24 @@ class SBBPyGui(QMainWindow):
         idx = -1
         if not(index is None):
             idx = self.port_input.itemData(index.row())
-        if idx == -1:
-            self.port_input.clear()
-            ports = serial.tools.list_ports.comports()
-            for port in ports:
-                self.port_input.addItem(port.device, 0)
-            self.port_input.addItem("Refresh", -1)   
-            self.port_input.setCurrentIndex(0)     
+        if idx == -1 and self.port_thread is None:
+            # Enumerating the ports may take a while, scan them on a separate thread
+            self.port_thread = QThread()
+            self.port_scanner = PortScanner()
+            self.port_scanner.moveToThread(self.port_thread)
+            self.port_scanner.finished.connect(self.on_port_scan_finished)
+            self.port_thread.started.connect(self.port_scanner.scan)
+            self.port_thread.start()
+
+    def on_port_scan_finished(self, ports):
+        self.port_thread.quit()
+        self.port_thread.wait()
+        self.port_thread = None
+        self.port_input.clear()
+        for port in ports:
+            self.port_input.addItem(port, 0)
+        self.port_input.addItem("Refresh", -1)
+        self.port_input.setCurrentIndex(0)
         
     def set_editable(self, flag: bool):
         self.port_input.setDisabled(not flag)
@@ -235,7 +433,7 @@ class SBBPyGui(QMainWindow):
             if not utils.valid_timeout(timeoutstr):
                 return
                 
-            port = self.port_input.currentText()
+            ports = [self.port_input.currentText()] + self.settings["comm"]["extra_ports"]
             baud = int(baudstr)
             timeout = int(timeoutstr)
 
@@ -243,8 +441,9 @@ class SBBPyGui(QMainWindow):
             self.communication_status_label.setText("Opening Communication... Please wait.")
             
             # Start a new thread to execute target.begin
+            self.targets = [self.target] + [sbbtarget.SBBTarget() for _ in ports[1:]]
             self.thread = QThread()
-            self.worker = Worker(self.target, port, baud, timeout)
+            self.worker = Worker(self.targets, ports, baud, timeout)
             self.worker.moveToThread(self.thread)
             self.worker.finished.connect(self.on_open_communication_finished)
             self.thread.started.connect(self.worker.open_communication)
@@ -255,12 +454,10 @@ class SBBPyGui(QMainWindow):
 
             # Start a new thread to execute target.close
             if self.isrunning:
-                self.worker.stoptimer()
-                self.thread.quit()
-                self.thread.wait()
+                self.toggle_execution()
             
             self.thread = QThread()
-            self.worker = Worker(self.target)
+            self.worker = Worker(self.targets)
             self.worker.moveToThread(self.thread)
             self.worker.finished.connect(self.on_close_communication_finished)
             self.thread.started.connect(self.worker.close_communication)
@@ -268,33 +465,163 @@ class SBBPyGui(QMainWindow):
             
     def toggle_execution(self):
         if not self.isrunning:
-            self.thread = QThread(parent=self)
-            chart_update_factor = self.settings["gui"]["update_chart_factor"]
             max_fails = self.settings["comm"]["max_fails"]
             enable_log = self.enable_log_checkbox.isChecked()
-            self.worker = Executer(self.target, self.update_timer,self.signal_names, self.signal_list, chart_update_factor, max_fails, enable_log)
-            self.worker.moveToThread(self.thread)
-            self.worker.chart_updater.connect(self.update_signal_chart)
-            self.worker.exectime_updater.connect(self.update_execution_time)
-            self.worker.error_comm.connect(self.trow_error_comm)
-            self.isrunning = True
-            for signal_name, series in self.signal_series_dict.items():
-                series.clear()
-            self.execution_button.setText("Stop Execution")
-            self.enable_log_checkbox.setDisabled(True)
-            self.worker.starttimer()
-            self.thread.start()
+            acq_mode = self.settings["comm"]["acq_mode"]
+            sample_time = self.settings["comm"]["sample_time"]
+            stream_buffer = self.settings["comm"]["stream_buffer"]
+            pipeline_depth = self.settings["comm"]["pipeline_depth"]
+            buffer_size = max(self.settings["gui"]["buffer_size"], self.settings["gui"]["chart_window"])
+
+            # With subscribe, only the selected signals are sent by the target
+            channels = None
+            selected_ids = sorted(set(self.selected_signal_ids()))
+            if self.settings["comm"]["subscribe"] and len(self.targets) == 1 and 0 < len(selected_ids) < len(self.signal_names):
+                channels = selected_ids
+            self.set_channels(list(range(len(self.signal_names))) if channels is None else channels)
+            if not self.create_capture():
+                return
+            self.store = SampleStore(buffer_size, len(self.channels), history_bucket=self.settings["gui"]["history_bucket"])
+            self.create_log_writer([self.signal_names[signal_id] for signal_id in self.channels])
+            acquisition = create_acquisition(self.targets, self.target_signal_names, self.signal_names, self.store, self.settings["comm"], enable_log, self.log_writer, channels)
+            acquisition.capture = self.capture
+            self.start_execution(acquisition, "Stop Execution")
         else:
-            self.worker.stoptimer()
-            if self.enable_log_checkbox.isChecked(): # Get logged data
-                self.loggeddata = self.worker.log_vals
-            else:
-                self.loggeddata = {}
-            self.thread.quit()
-            self.thread.wait()
+            self.executer.stop()
+            self.finish_log()
+            self.update_signal_chart(self.store.count - 1) # Samples after the last update
             self.execution_button.setText("Start Execution")
             self.enable_log_checkbox.setDisabled(False)
             self.isrunning = False
+            self.end_replay()
+
+    def create_capture(self):
+        # Capture of the windows around the trigger events when logging with a trigger, returns False on invalid settings
+        self.capture = None
+        kind = self.trigger_input.currentData()
+        if not self.enable_log_checkbox.isChecked() or kind == "off":
+            return True
+        triggers = []
+        if kind != "manual": # On the signal of the settings, or on the first selected one
+            name = self.settings["trigger"]["signal"]
+            if not name:
+                selected_ids = sorted(set(self.selected_signal_ids()))
+                name = self.signal_names[selected_ids[0]] if len(selected_ids) > 0 else ""
+            signal_id = self.signal_ids.get(name)
+            if signal_id is None or not(signal_id in self.channel_columns):
+                self.execution_time_display.setText("Error: No Trigger Signal Selected")
+                return False
+            try:
+                level = float(self.trigger_level_input.text())
+            except ValueError:
+                self.execution_time_display.setText("Error: Invalid Trigger Level")
+                return False
+            triggers.append(trigger.Trigger(kind, self.channel_columns[signal_id], level, f"{kind}({name})"))
+        self.capture = trigger.Capture(triggers, len(self.channels), self.settings["trigger"]["pre"], self.settings["trigger"]["post"])
+        return True
+
+    def fire_trigger(self):
+        if not(self.capture is None):
+            self.capture.fire()
+
+    def create_log_writer(self, signal_names):
+        self.log_writer = None
+        if self.enable_log_checkbox.isChecked() and self.settings["gui"]["log_mode"] == "file": # Stream the log to disk
+            os.makedirs(self.settings["gui"]["log_dir"], exist_ok=True)
+            self.log_file = os.path.join(self.settings["gui"]["log_dir"], time.strftime("sbblog_%Y%m%d_%H%M%S.sbblog"))
+            self.log_writer = logwriter.LogWriter(self.log_file, signal_names)
+
+    def start_execution(self, acquisition, stop_text):
+        # Run the acquisition, or the replay, feeding the chart
+        self.executer = Executer(acquisition)
+        if not(self.publisher is None):
+            self.publisher.start_session(acquisition.signal_names)
+            acquisition.publisher = self.publisher
+        self.executer.error_comm.connect(self.trow_error_comm)
+        self.executer.finished.connect(self.on_replay_finished)
+        self.executer.reconnecting.connect(self.on_reconnecting)
+        self.isrunning = True
+        for signal_name, series in self.signal_series_dict.items():
+            series.clear()
+        self.execution_button.setText(stop_text)
+        self.execution_button.setDisabled(False)
+        self.enable_log_checkbox.setDisabled(True)
+        self.replay_button.setDisabled(True)
+        self.trigger_button.setDisabled(self.capture is None)
+        self.render_metrics = Metrics()
+        for target in self.targets:
+            target.metrics = Metrics()
+        self.executer.start()
+        self.metrics_timer.start()
+        self.rendered_count = 0
+        self.render_timer.setInterval(self.settings["gui"]["update_time"])
+        self.render_timer.start()
+
+    def render(self):
+        # Redraw when new samples arrived, at a rate adapted to the frame time
+        count = self.store.count # Read without the lock, only compared
+        if count == self.rendered_count:
+            return
+        self.rendered_count = count
+        frame_start = time.perf_counter_ns()
+        self.update_signal_chart(count - 1)
+        exectime = self.executer.acquisition.exectime
+        if not np.isnan(exectime):
+            self.update_execution_time(float(exectime))
+        self.render_metrics.count("frames")
+
+        # Rendering takes at most render_load of the GUI thread, between update_time and update_max_time
+        frame_ms = (time.perf_counter_ns() - frame_start)/1e6
+        interval = min(max(frame_ms/self.settings["gui"]["render_load"], self.settings["gui"]["update_time"]), self.settings["gui"]["update_max_time"])
+        self.render_timer.setInterval(int(interval))
+
+    def replay_log(self):
+        # Replay a saved log through the chart, with the communication closed
+        if self.isrunning or self.target.isOpen():
+            self.execution_time_display.setText("Error: Close the communication to replay a log")
+            return
+        filename, _ = QFileDialog.getOpenFileName(self, "Replay log file", self.settings["gui"]["log_dir"], ";;".join(replay.formats.values()))
+        if not filename:
+            return
+        self.start_replay(filename)
+
+    def start_replay(self, filename):
+        try:
+            source = replay.LogSource(filename, self.settings["comm"]["sample_time"])
+        except (OSError, ValueError, KeyError) as e:
+            self.execution_time_display.setText(f"Error: {e}")
+            return
+
+        self.set_signal_names(source.signal_names)
+        self.set_channels(list(range(len(self.signal_names))))
+        if not self.create_capture():
+            return
+        buffer_size = max(self.settings["gui"]["buffer_size"], self.settings["gui"]["chart_window"])
+        self.store = SampleStore(buffer_size, len(self.signal_names), history_bucket=self.settings["gui"]["history_bucket"])
+        self.create_log_writer(self.signal_names)
+        acquisition = replay.Replay(source, self.store, self.replay_speed_input.currentData(), enable_log=self.enable_log_checkbox.isChecked(), log_writer=self.log_writer)
+        acquisition.capture = self.capture
+        self.communication_button.setDisabled(True)
+        self.start_execution(acquisition, "Stop Replay")
+
+    @Slot(bool)
+    def on_reconnecting(self, reconnecting):
+        # The acquisition resumes on the same buffers and log once the target is back
+        if reconnecting:
+            self.communication_status_label.setText("Communication Status: Lost, Reconnecting...")
+        else:
+            self.communication_status_label.setText("Communication Status: Open")
+
+    def on_replay_finished(self):
+        if self.isrunning: # Not stopped by the user in the meantime
+            self.toggle_execution()
+
+    def end_replay(self):
+        # Without communication, only another replay can be started
+        self.replay_button.setDisabled(False)
+        self.communication_button.setDisabled(False)
+        if not self.target.isOpen():
+            self.execution_button.setDisabled(True)
 
     def on_close_communication_finished(self):
         self.thread.quit()  # Stop the thread
@@ -312,7 +639,7 @@ class SBBPyGui(QMainWindow):
     def on_open_communication_finished(self):
         self.thread.quit()  # Stop the thread
         self.setDisabled(False)
-        if self.target.isOpen():
+        if all(target.isOpen() for target in self.targets):
             self.communication_button.setText("Close Communication")
             self.communication_status_label.setText("Communication Status: Open")
             self.update_signal_list()
@@ -323,14 +650,34 @@ class SBBPyGui(QMainWindow):
         
         self.comm_status_str = self.communication_status_label.text()
 
+    def finish_log(self):
+        # Keep the metrics of the execution
+        self.metrics_timer.stop()
+        self.render_timer.stop()
+        self.session_metrics = self.collect_metrics(full=True)
+        self.trigger_button.setDisabled(True)
+
+        # Get logged data
+        if not(self.log_writer is None): # Logged to file, map it back
+            self.log_writer.close()
+            self.log_writer = None
+            self.loggeddata = logwriter.load_log(self.log_file)
+            self.save_metrics(self.log_file)
+        elif self.enable_log_checkbox.isChecked():
+            self.loggeddata = self.executer.acquisition.log_vals
+        else:
+            self.loggeddata = {}
+
     def trow_error_comm(self):
-        self.worker.stoptimer()
-        self.thread.quit()
-        self.thread.wait()
+        if not self.isrunning: # Already stopped
+            return
+        self.executer.stop()
+        self.finish_log() # Keep what was logged before the error
         self.execution_time_display.setText("Execution Status: Error")
         self.execution_button.setText("Start Execution")
         self.enable_log_checkbox.setDisabled(False)
         self.isrunning = False
+        self.end_replay()
 
     @Slot(float)
     def update_execution_time(self, exectime):
@@ -338,80 +685,303 @@ class SBBPyGui(QMainWindow):
 
     def clear_signal_list(self):
         # Clear the list view and signal ID dictionary
-        self.signal_list_model.clear()
-        self.signal_names = []
+        self.set_signal_names([])
 
     def update_signal_list(self):
-        # Get the signal names from the target
-        self.signal_names = self.target.get_signames()
+        # Get the signal names from the targets, prefixed with their port when there are several
+        self.target_signal_names = [target.get_signames() for target in self.targets]
+        if len(self.targets) == 1:
+            self.signal_names = self.target_signal_names[0]
+        else:
+            self.signal_names = merged_names([target.port for target in self.targets], self.target_signal_names)
         #self.signal_names = self.settings["signames"]
+        self.set_signal_names(self.signal_names)
 
-        # Clear the list view and signal ID dictionary
-        self.signal_list_model.clear()
+    def set_signal_names(self, signal_names):
+        self.signal_names = signal_names
+        self.signal_ids = {signal_name: signal_id for signal_id, signal_name in enumerate(signal_names)}
+        self.derived = {}
+        self.selected_names = set()
 
-        # Populate the list view with signal names and IDs
-        for signal_name in self.signal_names:
-            item = QStandardItem(signal_name)
-            self.signal_list_model.appendRow(item)
+        # Populate the list view with the signal names
+        self.signal_list_model.setStringList(self.signal_names)
 
         # Update the signal series in the chart
         self.create_signal_series()
 
+    def set_channels(self, channels):
+        self.channels = channels
+        self.channel_columns = {signal_id: column for column, signal_id in enumerate(channels)}
+
+    def filter_signal_list(self, text):
+        # Show the names containing text, the selection of the hidden ones is kept
+        self.filtering = True # Rows filtered out are deselected by the view
+        self.signal_list_proxy.setFilterFixedString(text)
+        self.filtering = False
+        selection = QItemSelection()
+        for row in range(self.signal_list_proxy.rowCount()):
+            index = self.signal_list_proxy.index(row, 0)
+            if index.data() in self.selected_names:
+                selection.select(index, index)
+        self.signal_list.selectionModel().select(selection, QItemSelectionModel.Select)
+
+    def on_signal_selection_changed(self, selected, deselected):
+        # Rows filtered out of the list leave the selection without being deselected
+        if self.filtering:
+            return
+        for index in deselected.indexes():
+            self.selected_names.discard(index.data())
+        for index in selected.indexes():
+            self.selected_names.add(index.data())
+        self.update_series_visibility()
+
     def create_signal_series(self):
         # Remove all existing series from the chart
         self.chart.removeAllSeries()
-
-        # Create a QLineSeries for each signal and add them to the chart
-        for signal_name in self.signal_names:
-            series = QtCharts.QLineSeries()
-            series.setName(signal_name)
-            series.setVisible(False)
+        self.spectrum_chart.removeAllSeries()
+        self.signal_series_dict = {} # Deleted with the chart series
+
+        # Create a QLineSeries for each selected signal and derived channel
+        for name in self.selected_names:
+            self.add_series(name)
+
+    def add_series(self, name):
+        # Series attached to the X and Y axes, of the spectrum chart for spectral channels
+        series = QtCharts.QLineSeries()
+        series.setName(name)
+        if name in self.derived and self.derived[name][0] in derived.spectral_kinds:
+            self.spectrum_chart.addSeries(series)
+            series.attachAxis(self.freq_axis)
+            series.attachAxis(self.psd_axis)
+        else:
             self.chart.addSeries(series)
-            self.signal_series_dict[signal_name] = series
-
-        # Attach the X and Y axes to the series
-        for series in self.signal_series_dict.values():
             series.attachAxis(self.x_axis)
             series.attachAxis(self.y_axis)
+        self.signal_series_dict[name] = series
+
+    def selected_signal_ids(self):
+        # Ids of the selected signals and of the signals of the selected derived channels
+        signal_ids = []
+        for name in self.selected_names:
+            if name in self.derived:
+                signal_ids.append(self.derived[name][1])
+            else:
+                signal_ids.append(self.signal_ids[name])
+        return signal_ids
+
+    def add_derived(self):
+        # Derived channel of the selected kind for each selected signal
+        kind = self.derived_input.currentData()
+        for signal_name in sorted(self.selected_names, key=lambda name: self.signal_ids.get(name, -1)):
+            if not(signal_name in self.signal_ids): # Not derived from derived channels
+                continue
+            name = derived.derived_name(kind, signal_name)
+            if name in self.derived:
+                continue
+            self.derived[name] = (kind, self.signal_ids[signal_name])
+            row = self.signal_list_model.rowCount()
+            self.signal_list_model.insertRows(row, 1)
+            self.signal_list_model.setData(self.signal_list_model.index(row, 0), name)
+
+    def remove_derived(self):
+        # Remove the selected derived channels
+        names = [name for name in self.selected_names if name in self.derived]
+        for name in names:
+            del self.derived[name]
+            self.selected_names.discard(name)
+            self.signal_list_model.removeRows(self.signal_list_model.stringList().index(name), 1)
+        self.update_series_visibility()
 
     def update_series_visibility(self):
-        # Get the selected signal IDs from the list view
-        selected_indexes = self.signal_list.selectedIndexes()
-        # selected_signal_ids = [index.row() for index in selected_indexes]
-        selected_signal_names = [index.data() for index in selected_indexes]
-        
-        # Show the selected series and hide the others
-        for signal_name, series in self.signal_series_dict.items():
-            series.setVisible(signal_name in selected_signal_names) 
-
-    @Slot(float, list, dict)
-    def update_signal_chart(self, chart_count, chart_count_vals, signal_vals_dict):
-
-        # Set chart data
-        for signal_name, series in self.signal_series_dict.items():
-            for x, y in zip(chart_count_vals, signal_vals_dict[signal_name]):
-                series.append(x, y)
-            while series.count() > self.settings["gui"]["chart_window"]:
-                series.removePoints(0, 1)
-
-        # Set X Axis
-        self.update_axis_range(chart_count)
+        # Release the series of the signals deselected, their points go with them
+        for name in [name for name in self.signal_series_dict if not(name in self.selected_names)]:
+            series = self.signal_series_dict.pop(name)
+            series.chart().removeSeries(series)
+            series.deleteLater()
+
+        # Create the series of the signals just selected
+        for name in self.selected_names:
+            if not(name in self.signal_series_dict):
+                self.add_series(name)
+        self.spectrum_view.setVisible(any(name in self.signal_series_dict for name, (kind, _) in self.derived.items() if kind in derived.spectral_kinds))
+
+        # Fill the series just shown and rescale to them
+        if not(self.store is None):
+            self.update_signal_chart(self.store.count - 1)
+            self.update_axis_range(self.store.count - 1, force=True)
+
+    @Slot(int)
+    def update_signal_chart(self, chart_count):
+        frame_start = time.perf_counter_ns()
+
+        # Copy the samples to show of the visible signals, replaceNp needs contiguous float64 arrays
+        zoomed = self.is_zoomed()
+        visible_ids, visible_columns = self.visible_columns()
+        visible_derived = [(name, kind, self.channel_columns[signal_id]) for name, (kind, signal_id) in self.derived.items() if name in self.signal_series_dict and signal_id in self.channel_columns]
+        width = max(int(self.chart.plotArea().width()), 1)
+        if self.session_view and (self.x_axis.min() != 0 or self.x_axis.max() != max(chart_count, 1)): # Follow the growth of the session
+            self.x_axis.setRange(0, max(chart_count, 1))
+        history_vals = None
+        with self.store.lock:
+            if zoomed and not(self.store.history is None) and (self.session_view or self.x_axis.min() < self.store.count - len(self.store)):
+                # Whole session or older than the buffer: min and max from the history, querying only the level matching the chart width
+                x, ys = self.store.history.query(visible_columns, self.x_axis.min(), self.x_axis.max(), width)
+                history_vals = (x, ys, self.store.history.extrema(visible_columns))
+            else:
+                if zoomed: # Zoomed X range at full resolution, as far as the buffer goes
+                    chart_count_vals, signal_vals = self.store.last(len(self.store))
+                    first, last = np.searchsorted(chart_count_vals, [self.x_axis.min(), self.x_axis.max()])
+                    first = max(first - 1, 0) # Keep the lines going to the chart borders
+                    chart_count_vals = chart_count_vals[first:last + 1]
+                    signal_vals = signal_vals[first:last + 1]
+                    host_ns = self.store.last_host_ns(len(self.store))[first:last + 1]
+                else:
+                    chart_count_vals, signal_vals = self.store.last(self.settings["gui"]["chart_window"])
+                    host_ns = self.store.last_host_ns(self.settings["gui"]["chart_window"])
+                chart_count_vals = chart_count_vals.astype(np.float64)
+                visible_vals = [signal_vals[:, column].astype(np.float64) for column in visible_columns]
+                derived_vals = [signal_vals[:, column].astype(np.float64) for _, _, column in visible_derived]
+                fs = derived.sample_rate(host_ns) if len(visible_derived) > 0 else None
+        if not(history_vals is None):
+            self.update_history_chart(visible_ids, visible_derived, *history_vals)
+            self.render_metrics.observe("frame", time.perf_counter_ns() - frame_start)
+            return
 
-    def update_axis_range(self, count):  
+        # Rebuild each visible series in a single call, decimated to the chart width
+        for signal_id, vals in zip(visible_ids, visible_vals):
+            x, y = self.decimate_series(chart_count_vals, vals, width)
+            self.signal_series_dict[self.signal_names[signal_id]].replaceNp(x, y)
+        self.update_derived_series(visible_derived, derived_vals, chart_count_vals, fs, width)
+
+        # Set X Axis, the zoomed range is left to the user
+        if not zoomed:
+            self.update_axis_range(chart_count)
+        self.render_metrics.observe("frame", time.perf_counter_ns() - frame_start)
+
+    def update_history_chart(self, visible_ids, visible_derived, x, ys, extrema):
+        # Min and max pairs of each bucket are already at the chart resolution, no decimation needed
+        for signal_id, y in zip(visible_ids, ys):
+            self.signal_series_dict[self.signal_names[signal_id]].replaceNp(x, y)
+        for name, _, _ in visible_derived: # Derived channels need the full samples, only in the buffer
+            self.signal_series_dict[name].replaceNp(np.zeros(0), np.zeros(0))
+        min_value, max_value = extrema
+        if self.session_view and not(min_value is None):
+            self.update_y_range(min_value, max_value)
+
+    def update_derived_series(self, visible_derived, derived_vals, chart_count_vals, fs, width):
+        # Derived channels computed over the whole window in one go
+        if fs is None: # Not enough samples, assume the nominal rate
+            fs = 1000.0/self.settings["comm"]["sample_time"] if self.settings["comm"]["sample_time"] > 0 else 1000.0
+        gui = self.settings["gui"]
+        self.derived_range = None
+        psd_min = np.inf
+        psd_max = -np.inf
+        for (name, kind, _), vals in zip(visible_derived, derived_vals):
+            freqs, y = derived.compute(kind, vals, fs, gui["derived_cutoff"], gui["filter_order"], gui["psd_segment"])
+            if freqs is None: # Against the sample, as the signals
+                x, y = self.decimate_series(chart_count_vals, y, width)
+                if len(y) > 0:
+                    low, high = float(np.min(y)), float(np.max(y))
+                    self.derived_range = (low, high) if self.derived_range is None else (min(self.derived_range[0], low), max(self.derived_range[1], high))
+            else: # Against the frequency, the log axis needs positive values
+                x, y = freqs, np.maximum(y, np.finfo(np.float64).tiny)
+                if len(y) > 0:
+                    psd_min = min(psd_min, float(np.min(y)))
+                    psd_max = max(psd_max, float(np.max(y)))
+            self.signal_series_dict[name].replaceNp(np.ascontiguousarray(x, dtype=np.float64), np.ascontiguousarray(y, dtype=np.float64))
+
+        # Spectrum axes up to the Nyquist frequency
+        if psd_min <= psd_max:
+            self.freq_axis.setRange(0, fs/2)
+            self.psd_axis.setRange(psd_min, max(psd_max, psd_min*10))
+
+    def visible_columns(self):
+        # Signal ids of the visible series held in the store, and their store columns
+        visible = sorted((self.signal_ids[name], self.channel_columns[self.signal_ids[name]]) for name in self.signal_series_dict if name in self.signal_ids and self.signal_ids[name] in self.channel_columns)
+        return [signal_id for signal_id, _ in visible], [column for _, column in visible]
+
+    def decimate_series(self, x, y, width):
+        render_mode = self.settings["gui"]["render_mode"]
+        if render_mode == "minmax": # Min and max for each pixel column
+            x, y = decimate.minmax(x, y, width)
+        elif render_mode == "lttb": # Two points per pixel column
+            x, y = decimate.lttb(x, y, 2*width)
+        return np.ascontiguousarray(x), np.ascontiguousarray(y)
+
+    def is_zoomed(self):
+        # X range chosen by the user instead of following the last samples
+        return self.chart.isZoomed() or self.panned or self.session_view
+
+    def on_x_range_changed(self, xmin, xmax):
+        # Fetch the finer detail of a new zoom when no update is coming
+        if self.is_zoomed() and not(self.store is None) and not self.isrunning:
+            self.update_signal_chart(self.store.count - 1)
+
+    def show_session(self):
+        # Whole session from the history, following its growth while running
+        if self.store is None or self.store.history is None:
+            return
+        self.session_view = True
+        self.update_signal_chart(self.store.count - 1)
+
+    def eventFilter(self, obj, event):
+        # Wheel zooms the X axis around the cursor, dragging with the middle button pans it
+        if self.store is None:
+            return False
+        if event.type() == QEvent.Wheel:
+            position = self.chart.mapFromScene(self.chart_view.mapToScene(event.position().toPoint()))
+            x = self.chart.mapToValue(position).x()
+            factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+            xmin, xmax = self.x_axis.min(), self.x_axis.max()
+            self.session_view = False
+            self.panned = True
+            self.x_axis.setRange(x - (x - xmin)*factor, x + (xmax - x)*factor)
+            return True
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.MiddleButton:
+            self.pan_x = event.position().x()
+            return True
+        if event.type() == QEvent.MouseMove and event.buttons() & Qt.MiddleButton:
+            self.session_view = False
+            self.panned = True
+            self.chart.scroll(self.pan_x - event.position().x(), 0)
+            self.pan_x = event.position().x()
+            return True
+        return False
+
+    def reset_zoom(self):
+        # Go back to following the last samples
+        self.session_view = False
+        self.panned = False
+        self.chart.zoomReset()
+        if not(self.store is None):
+            self.update_signal_chart(self.store.count - 1)
+            self.update_axis_range(self.store.count - 1, force=True)
+
+    def update_axis_range(self, count, force=False):  
         xrange_init = (count // self.settings["gui"]["chart_window"])*self.settings["gui"]["chart_window"]
         self.x_axis.setRange(xrange_init, xrange_init + self.settings["gui"]["chart_window"])
 
-        # Inizializza i valori minimi e massimi con il primo valore della serie
-        min_value = float('inf')
-        max_value = float('-inf')
-
-        # Trova i valori minimi e massimi nella serie
-        for series in self.signal_series_dict.values():
-            if series.isVisible():
-                for point in series.pointsVector():
-                    y_value = point.y()
-                    min_value = min(min_value, y_value)
-                    max_value = max(max_value, y_value)
+        # Min and max of the visible signals from the block extrema of the store
+        if self.store is None:
+            return
+        _, visible_columns = self.visible_columns()
+        with self.store.lock:
+            min_value, max_value = self.store.extrema(visible_columns, self.settings["gui"]["chart_window"])
+        if not(self.derived_range is None): # Derived channels shown with the signals
+            min_value = self.derived_range[0] if min_value is None else min(min_value, self.derived_range[0])
+            max_value = self.derived_range[1] if max_value is None else max(max_value, self.derived_range[1])
+        if min_value is None: # Nothing to show
+            return
+        self.update_y_range(min_value, max_value, force)
+
+    def update_y_range(self, min_value, max_value, force=False):
+        # Keep the current range while the data fits and still fills enough of it
+        axis_min = self.y_axis.min()
+        axis_max = self.y_axis.max()
+        fits = min_value >= axis_min and max_value <= axis_max
+        fills = (max_value - min_value) >= (1 - self.settings["gui"]["axis_hysteresis"])*(axis_max - axis_min)
+        if fits and fills and not force:
+            return
 
         # Imposta il range dell'asse Y in base ai valori minimi e massimi
         y_range = max_value - min_value
@@ -425,123 +995,100 @@ class SBBPyGui(QMainWindow):
 
     def closeEvent(self, event):
         # Personalized close function, perform any closing tasks here
-        if self.target.isOpen(): # Load only if comm open
-            self.target.close()  # Close the communication with the target
+        if self.isrunning: # Stop the acquisition thread and write the log before closing the ports
+            self.toggle_execution()
+        for target in self.targets:
+            if target.isOpen(): # Load only if comm open
+                target.close()  # Close the communication with the target
+        if not(self.publisher is None):
+            self.publisher.close()
 
         # Call the parent class closeEvent to ensure proper closing of the application
         super().closeEvent(event)
 
 class Executer(QObject):
-    chart_updater = Signal(float, list, dict)
-    exectime_updater = Signal(float)
     error_comm = Signal()
-    chart_count = 0 # Counter for the chart
-    chart_update_factor = 1
-    chart_count_vals = [] # List to store the counter values
-    signal_names = [] # Names of the signals
-    signal_vals_dict = {} # Dictionary to store the values of the signals
-    log_vals = {} #Dictionary to store the values logged
-    fails = 0
-    max_fails = 10
-    signal_length = 1
-    enable_log = False
-
-    def __init__(self, target, timer, signal_names, signal_list, chart_update_factor, max_fails, enable_log):
+    finished = Signal()
+    reconnecting = Signal(bool)
+
+    def __init__(self, acquisition):
         super().__init__()
-        self.target = target
-        self.timer = timer
-        self.timer.timeout.connect(self.update)
-        self.chart_count = 0
-        self.fails = 0
-        self.enable_log = enable_log
-        self.chart_update_factor = chart_update_factor
-        self.signal_names = signal_names
-        self.signal_length = len(signal_names)
-        self.signal_list = signal_list
-        self.max_fails = max_fails
-        self.reset_signal_vals_dict()
-        self.reset_log_vals()
-
-    def starttimer(self):
-        self.timer.start()
-        
-    def stoptimer(self):
-        self.timer.stop()
-
-    def update(self):
-        # Read data and append to dictionary
-        data, _ = self.target.get_signals(self.signal_length)
-        if data is None: # No read
-            self.fails = self.fails + 1
-            if self.fails > self.max_fails:
-                self.error_comm.emit()
-                return
-            return
-        self.fails = 0 #Reset
+        self.acquisition = acquisition # Runs the acquisition on its own thread, the chart pulls from its store
+        self.acquisition.on_error = self.error_comm.emit
+        self.acquisition.on_end = self.finished.emit
+        self.acquisition.on_reconnect = self.reconnecting.emit
 
-        # Get exec time
-        exectime = self.target.get_exectime()
-        
-        # Log data
-        if self.enable_log:
-            self.log_vals["sample"].append(self.chart_count)
-            self.log_vals["time"].append(exectime)
-            
-        # Add counter to the count list
-        self.chart_count_vals.append(self.chart_count)
+    def start(self):
+        if not self.acquisition.start():
+            self.error_comm.emit()
 
-        for signal_id, signal_name in enumerate(self.signal_names):
-            self.signal_vals_dict[signal_name].append(data[signal_id])
-            if self.enable_log:
-                self.log_vals[signal_name].append(data[signal_id])
+    def stop(self):
+        self.acquisition.stop()
 
 
-        # Update chart
-        if self.chart_count % self.chart_update_factor == 0:
-            self.chart_updater.emit(self.chart_count, self.chart_count_vals, self.signal_vals_dict)
-            self.reset_signal_vals_dict()
-            if not(exectime is None):
-                self.exectime_updater.emit(exectime)
-            
-        # Increment the chart count
-        self.chart_count = self.chart_count + 1
+class Exporter(QObject):
+    progress = Signal(int)
+    finished = Signal(str)
+
+    def __init__(self, log_vals, filename):
+        super().__init__()
+        self.log_vals = log_vals
+        self.filename = filename
+        self.cancelled = False
+
+    def cancel(self):
+        # Called from the GUI thread, checked between chunks
+        self.cancelled = True
+
+    def export(self):
+        error = ""
+        export = logexport.export_log(self.log_vals, self.filename)
+        try:
+            for fraction in export:
+                self.progress.emit(int(100*fraction))
+                if self.cancelled:
+                    error = "Log not saved"
+                    break
+        except (OSError, ValueError) as e:
+            error = str(e)
+        export.close() # Removes the partial file when cancelled
+        self.finished.emit(error)
+
 
-    def reset_signal_vals_dict(self):
-        self.chart_count_vals = []
-        for signal_name in self.signal_names:
-            self.signal_vals_dict[signal_name] = []
+class PortScanner(QObject):
+    finished = Signal(list)
 
-    def reset_log_vals(self):
-        self.log_vals = {}
-        for signal_name in self.signal_names:
-            self.log_vals[signal_name] = []
-        self.log_vals["sample"] = []
-        self.log_vals["time"] = []
+    def scan(self):
+        self.finished.emit([port.device for port in serial.tools.list_ports.comports()])
 
 
 class Worker(QObject):
     finished = Signal()
  
-    def __init__(self, target, port = None, baud = None, timeout = None):
+    def __init__(self, targets, ports = None, baud = None, timeout = None):
         super().__init__()
-        self.target = target
-        if not(port is None):
-            self.target.port = port
-        if not(baud is None):
-            self.target.baud = baud
-        if not(timeout is None):
-            self.target.timeout = float(timeout)/1000.0
+        self.targets = targets
+        for k, target in enumerate(self.targets):
+            if not(ports is None):
+                target.port = ports[k]
+            if not(baud is None):
+                target.baud = baud
+            if not(timeout is None):
+                target.timeout = float(timeout)/1000.0
             
 
     def open_communication(self):
-        # Open the communication
+        # Open the communication, with all the targets or none
         try:
-            self.target.open()
+            for target in self.targets:
+                target.open()
         except serial.SerialException as e:
-            pass
+            for target in self.targets:
+                target.close()
         self.finished.emit()
 
     def close_communication(self):
         # Close the communication
-        self.target.close()
+        for target in self.targets:
+            target.close()
         self.finished.emit()
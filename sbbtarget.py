@@ -1,14 +1,71 @@
-import serial, struct
+import serial, struct, threading, collections, time, zlib
+import numpy as np
+from metrics import Metrics
 
 class SBBTarget(serial.Serial):
 
     sigvals_request = b'\x01'
     exectime_request = b'\x02'
     signames_request = b'\x03'
+    stream_start_request = b'\x04'
+    stream_stop_request = b'\x05'
+    sample_request = b'\x06'
+    subscribe_request = b'\x07'
+    framing_request = b'\x08'
     split_char = b'\x00'
+    frame_sync = b'\xa5\x5a' # Start of each frame in framed mode
+
+    streaming = False # True while the target is pushing frames
+    stream_error = False # Set by the reader thread on serial errors
+    stream_dropped = 0 # Frames discarded because the ring buffer was full
+    in_flight = 0 # Pipelined requests sent but not answered yet
+    subscription = None # Signal indexes carried by the frames, None for all
+    framed = False # Sample frames wrapped with sync marker, sequence number and CRC
+    frames_lost = 0 # Frames missing from the sequence or failing the CRC in framed mode
 
     def __init__(self):
         super().__init__()
+        self.metrics = Metrics() # Link statistics
+
+    def transaction(self, request: bytes, size: int):
+        # Send a request and read a reply of size bytes, returns None on failure
+        start = time.perf_counter_ns()
+        try:
+            if self.write(request) < len(request):
+                self.metrics.count("write_errors")
+                return None
+        except serial.SerialException as e:
+            self.metrics.count("write_errors")
+            return None
+        self.metrics.count("bytes_written", len(request))
+
+        # Read data
+        data_bytes = self.read(size)
+        self.metrics.count("requests")
+        self.metrics.count("bytes_read", len(data_bytes))
+        if len(data_bytes) == 0: # Nothing before the timeout
+            self.metrics.count("timeouts")
+            self.discard_late_reply()
+            return None
+        if len(data_bytes) < size: # Not enough bytes read...
+            self.metrics.count("short_reads")
+            self.discard_late_reply()
+            return None
+        self.metrics.observe("rtt", time.perf_counter_ns() - start)
+        return data_bytes
+
+    def discard_late_reply(self):
+        # The rest of a reply arriving after the timeout would shift all the next replies
+        try:
+            self.reset_input_buffer()
+        except serial.SerialException as e:
+            pass
+
+    def close(self):
+        # Stop the reader thread before releasing the port
+        if self.streaming:
+            self.stop_stream()
+        super().close()
 
     def get_signames(self):
         # Send request byte
@@ -26,34 +83,363 @@ class SBBTarget(serial.Serial):
         del signames[-1]  
         return signames
 
-    def get_signals(self, num_sig: int):   
-        # Send request byte
-        try:
-            if self.write(self.sigvals_request) < 1:
-                return None, None
+    def subscribe(self, indexes):
+        # Frames carry only the signals at indexes from now on, None or [] for all of them
+        # Request byte, uint16 count and uint16 indexes, the target acknowledges with the count
+        indexes = [] if indexes is None else list(indexes)
+        request = self.subscribe_request + struct.pack(f'<H{len(indexes)}H', len(indexes), *indexes)
+        ack = self.transaction(request, 2)
+        if ack is None or struct.unpack('<H', ack)[0] != len(indexes):
+            try: # Firmware without subscriptions, drop whatever it answered
+                self.reset_input_buffer()
+            except serial.SerialException as e:
+                pass
+            return False
+        self.subscription = indexes if len(indexes) > 0 else None
+        return True
+
+    def set_framing(self, enable: bool):
+        # In framed mode the sample frames (combined replies and stream) are sent as
+        # sync marker, uint16 sequence number, signal values and exec time, CRC32 of sequence number and values
+        # Request byte and 1 to enable or 0 to disable, the target acknowledges with the same byte
+        flag = b'\x01' if enable else b'\x00'
+        try: # Late replies would be taken for the acknowledgment
+            self.reset_input_buffer()
         except serial.SerialException as e:
-            return None, None
+            return False
+        ack = self.transaction(self.framing_request + flag, 1)
+        if ack != flag:
+            try: # Firmware without framing, drop whatever it answered
+                self.reset_input_buffer()
+            except serial.SerialException as e:
+                pass
+            return False
+        self.framed = enable
+        self.frame_pending = bytearray() # Bytes received after the last whole frame
+        self.frame_seq = None # Sequence number of the last valid frame
+        if enable:
+            self.frames_lost = 0
+        return True
 
-        # Read data
-        data_bytes = self.read(num_sig*4)
-        if len(data_bytes) < (num_sig*4): # Not enough bytes read...
+    def frame_size(self, num_sig: int):
+        # Bytes per sample frame on the link
+        return (num_sig + 1)*4 + (8 if self.framed else 0)
+
+    def unframe(self, chunk, num_sig: int):
+        # Valid frames of the bytes received so far, returns their payloads joined and their number
+        # Runs of back to back frames are checked at once, the sync marker is searched for only after a bad frame
+        size = self.frame_size(num_sig)
+        self.frame_pending += chunk
+        data = bytes(self.frame_pending)
+        view = memoryview(data) # CRCs computed without copying the frames
+        payloads = []
+        seqs = []
+        pos = 0
+        while True:
+            start = data.find(self.frame_sync, pos)
+            if start < 0: # Keep the last byte, it may be the first half of a marker
+                skipped = max(len(data) - 1, pos) - pos
+                if skipped > 0:
+                    self.metrics.count("skipped_bytes", skipped)
+                pos = pos + skipped
+                break
+            if start > pos: # Bytes that are not a frame
+                self.metrics.count("resyncs")
+                self.metrics.count("skipped_bytes", start - pos)
+            pos = start
+            num_frames = (len(data) - start) // size
+            if num_frames == 0: # Partial frame
+                break
+
+            # Frames as long as the markers line up and the CRCs match
+            frames = np.frombuffer(data, dtype=np.uint8, count=num_frames*size, offset=start).reshape(num_frames, size)
+            synced = (frames[:, 0] == self.frame_sync[0]) & (frames[:, 1] == self.frame_sync[1])
+            num_synced = num_frames if synced.all() else int(np.argmin(synced))
+            crcs = np.fromiter((zlib.crc32(view[offset + 2:offset + size - 4]) for offset in range(start, start + num_synced*size, size)), dtype=np.uint32, count=num_synced)
+            valid = crcs == np.ascontiguousarray(frames[:num_synced, -4:]).view('<u4').ravel()
+            num_valid = num_synced if valid.all() else int(np.argmin(valid))
+            payloads.append(frames[:num_valid, 4:-4])
+            seqs.append(np.ascontiguousarray(frames[:num_valid, 2:4]).view('<u2').ravel())
+            pos = start + num_valid*size
+            if num_valid < num_synced: # Corrupt frame, counted as lost by the sequence, look for the next marker inside it
+                self.metrics.count("crc_errors")
+                pos = pos + 1
+            elif num_synced == num_frames:
+                break
+        del self.frame_pending[:pos]
+
+        # Frames missing from the sequence, older or repeated frames are not counted
+        seqs = np.concatenate(seqs).astype(np.int64) if len(seqs) > 0 else np.zeros(0, dtype=np.int64)
+        if len(seqs) > 0:
+            previous = np.concatenate(([seqs[0] - 1 if self.frame_seq is None else self.frame_seq], seqs[:-1]))
+            missing = (seqs - previous - 1) % 65536
+            lost = int(missing[missing < 32768].sum())
+            if lost > 0:
+                self.metrics.count("lost_frames", lost)
+                self.frames_lost = self.frames_lost + lost
+            self.frame_seq = int(seqs[-1])
+        payload = np.concatenate(payloads).tobytes() if len(payloads) > 0 else b''
+        return payload, len(seqs)
+
+    def get_signal_bytes(self, num_sig: int):
+        # Send request byte and return the raw float32 signal values, None on failure
+        return self.transaction(self.sigvals_request, num_sig*4)
+
+    def get_signals(self, num_sig: int):   
+        # Send request byte and read data
+        data_bytes = self.get_signal_bytes(num_sig)
+        if data_bytes is None:
             return None, None
         
         # Convert data to floats and return
         return struct.unpack('f' * num_sig, data_bytes), data_bytes
 
     def get_exectime(self):
-        # Send request byte
+        # Send request byte and read data
+        exectime_bytes = self.transaction(self.exectime_request, 4)
+        if exectime_bytes is None:
+            return None
+
+        return struct.unpack('f', exectime_bytes)[0]
+
+    def decode_frames(self, data_bytes, num_sig: int):
+        # Decode whole frames in one go, returns (n, num_sig) signal values and (n,) exec times
+        frames = np.frombuffer(data_bytes, dtype=np.float32).reshape(-1, num_sig + 1)
+        return frames[:, :-1], frames[:, -1]
+
+    def get_signals_batch(self, n: int, num_sig: int):
+        # Send n combined requests at once and read all the replies with one bulk read
+        if self.framed:
+            return self.get_frames_batch(n, num_sig)
+        frame_size = (num_sig + 1)*4
+        data_bytes = self.transaction(self.sample_request * n, n*frame_size)
+        if data_bytes is None:
+            return None, None, None
+
+        signals, exectimes = self.decode_frames(data_bytes, num_sig)
+        return signals, exectimes, data_bytes
+
+    def get_frames_batch(self, n: int, num_sig: int):
+        # Framed version of get_signals_batch, a short read keeps the partial frame for the next call
+        start = time.perf_counter_ns()
         try:
-            if self.write(self.exectime_request) < 1:
-                return None
+            written = self.write(self.sample_request * n)
+            chunk = self.read(n*self.frame_size(num_sig) - len(self.frame_pending))
         except serial.SerialException as e:
-            return None
+            self.metrics.count("write_errors")
+            return None, None, None
+        self.metrics.count("bytes_written", written)
+        self.metrics.count("requests", n)
+        self.metrics.count("bytes_read", len(chunk))
+        data_bytes, num_frames = self.unframe(chunk, num_sig)
+        if num_frames == 0:
+            self.metrics.count("timeouts")
+            return None, None, None
+        self.metrics.observe("rtt", time.perf_counter_ns() - start)
 
-        # Read data
-        exectime_bytes = self.read(4)
-        if len(exectime_bytes) < 4:  # Not enough bytes read...
-            return None
+        signals, exectimes = self.decode_frames(data_bytes, num_sig)
+        return signals, exectimes, data_bytes
 
-        return struct.unpack('f', exectime_bytes)[0]
+    def start_pipeline(self, num_sig: int, depth: int):
+        # Keep depth combined requests in flight
+        self.frame_num_sig = num_sig
+        self.pipeline_depth = depth
+        self.pipeline_pending = bytearray()
+        self.pipeline_sent = collections.deque() # Send time of each request in flight, for the round-trip times
+        self.in_flight = 0
+        try:
+            self.reset_input_buffer()
+            self.frame_pending = bytearray()
+            if self.write(self.sample_request * depth) < depth:
+                return False
+        except serial.SerialException as e:
+            return False
+        self.pipeline_sent.extend([time.perf_counter_ns()]*depth)
+        self.in_flight = depth
+        return True
+
+    def read_pipeline(self):
+        # Read the replies already arrived (waiting for at least one), returns (signal values, exec times) blocks
+        frame_size = self.frame_size(self.frame_num_sig)
+        pending = self.frame_pending if self.framed else self.pipeline_pending
+        try:
+            available = len(pending) + self.in_waiting
+            num_frames = min(max(available // frame_size, 1), self.in_flight)
+            chunk = self.read(max(num_frames*frame_size - len(pending), 0))
+        except serial.SerialException as e:
+            return None, None
+        self.metrics.count("bytes_read", len(chunk))
+
+        # Decode complete frames, partial ones stay pending
+        read_ns = time.perf_counter_ns()
+        lost = 0
+        if self.framed: # Lost replies are no longer in flight
+            lost = self.frames_lost
+            data_bytes, num_frames = self.unframe(chunk, self.frame_num_sig)
+            lost = self.frames_lost - lost
+            self.in_flight = max(self.in_flight - num_frames - lost, 0)
+            if num_frames == 0 and len(chunk) == 0: # Replies lost entirely, start over
+                self.in_flight = 0
+        else:
+            self.pipeline_pending += chunk
+            num_frames = len(self.pipeline_pending) // frame_size
+            data_bytes = bytes(self.pipeline_pending[:num_frames*frame_size])
+            del self.pipeline_pending[:num_frames*frame_size]
+            self.in_flight = self.in_flight - num_frames
+            if num_frames == 0 and len(chunk) == 0: # Replies lost entirely, drop what is left of them and start over
+                self.in_flight = 0
+                self.pipeline_pending = bytearray()
+                self.discard_late_reply()
+
+        # Round-trip time of each reply, from the send times in request order
+        for _ in range(min(lost, len(self.pipeline_sent))):
+            self.pipeline_sent.popleft()
+        rtts = [read_ns - self.pipeline_sent.popleft() for _ in range(min(num_frames, len(self.pipeline_sent)))]
+        if self.in_flight == 0:
+            self.pipeline_sent.clear()
+        self.metrics.observe("rtt", rtts)
+
+        # Refill the pipeline
+        try:
+            refill = self.pipeline_depth - self.in_flight
+            if refill > 0:
+                written = self.write(self.sample_request * refill)
+                self.pipeline_sent.extend([time.perf_counter_ns()]*written)
+                self.in_flight = self.in_flight + written
+                self.metrics.count("bytes_written", written)
+        except serial.SerialException as e:
+            return None, None
+
+        self.metrics.count("requests", num_frames)
+        if num_frames == 0: # Timeout
+            self.metrics.count("timeouts")
+            return None, None
+        return self.decode_frames(data_bytes, self.frame_num_sig)
+
+    def stop_pipeline(self):
+        # Wait for the outstanding replies so they do not end up in the next read
+        try:
+            self.read(max(self.in_flight*self.frame_size(self.frame_num_sig) - len(self.frame_pending if self.framed else self.pipeline_pending), 0))
+            self.reset_input_buffer()
+        except serial.SerialException as e:
+            pass
+        self.in_flight = 0
+
+    def start_stream(self, num_sig: int, buffer_size: int = 10000):
+        # Each streamed frame holds the signal values followed by the exec time
+        if self.streaming:
+            return True
+        self.frame_num_sig = num_sig
+        self.stream_buffer = collections.deque() # Chunks of whole frames with their host arrival time
+        self.stream_buffer_size = buffer_size # Maximum number of buffered frames
+        self.stream_buffered = 0
+        self.stream_lock = threading.Condition() # Notified when frames arrive
+        self.stream_dropped = 0
+        self.stream_error = False
+
+        # Discard stale bytes and send the start byte
+        try:
+            self.reset_input_buffer()
+            self.frame_pending = bytearray()
+            if self.write(self.stream_start_request) < 1:
+                return False
+        except serial.SerialException as e:
+            return False
+
+        # Start the reader thread
+        self.streaming = True
+        self.stream_thread = threading.Thread(target=self.stream_reader, daemon=True)
+        self.stream_thread.start()
+        return True
+
+    def stop_stream(self):
+        if not self.streaming:
+            return
+        self.streaming = False
+        try:
+            self.write(self.stream_stop_request)
+        except serial.SerialException as e:
+            pass
+        self.stream_thread.join() # Returns at most after one read timeout
+
+        # Drop the frames sent before the target stopped
+        try:
+            self.reset_input_buffer()
+        except serial.SerialException as e:
+            pass
+
+    def stream_reader(self):
+        frame_size = (self.frame_num_sig + 1)*4 # Frames in the ring buffer hold the values and exec time only
+        read_size = self.frame_size(self.frame_num_sig)
+        pending = bytearray()
+        while self.streaming:
+            # Read everything available, blocking for at least one frame
+            try:
+                chunk = self.read(max(self.in_waiting, read_size))
+            except serial.SerialException as e:
+                self.stream_error = True
+                break
+            if not chunk: # Timeout
+                self.metrics.count("timeouts")
+                continue
+            host_ns = time.perf_counter_ns()
+            self.metrics.count("bytes_read", len(chunk))
+            if self.framed: # Valid frames only
+                chunk, _ = self.unframe(chunk, self.frame_num_sig)
+            pending += chunk
+
+            # Move the complete frames into the ring buffer as a single chunk
+            num_frames = len(pending) // frame_size
+            if num_frames == 0:
+                continue
+            frames = bytes(pending[:num_frames*frame_size])
+            del pending[:num_frames*frame_size]
+            with self.stream_lock:
+                self.stream_buffer.append((frames, host_ns))
+                self.stream_buffered = self.stream_buffered + num_frames
+                while self.stream_buffered > self.stream_buffer_size: # Oldest frames are overwritten
+                    excess = self.stream_buffered - self.stream_buffer_size
+                    oldest, oldest_ns = self.stream_buffer[0]
+                    if len(oldest) // frame_size <= excess:
+                        self.stream_buffer.popleft()
+                        dropped = len(oldest) // frame_size
+                    else:
+                        self.stream_buffer[0] = (oldest[excess*frame_size:], oldest_ns)
+                        dropped = excess
+                    self.stream_buffered = self.stream_buffered - dropped
+                    self.stream_dropped = self.stream_dropped + dropped
+                    self.metrics.count("dropped", dropped)
+                self.stream_lock.notify()
+
+    def read_stream(self, timeout: float = 0):
+        # Drain the ring buffer waiting up to timeout for frames, returns (signal values, exec times, host times) blocks
+        with self.stream_lock:
+            if self.stream_buffered == 0 and timeout > 0:
+                self.stream_lock.wait(timeout)
+            chunks = list(self.stream_buffer)
+            self.stream_buffer.clear()
+            self.stream_buffered = 0
+        frame_size = (self.frame_num_sig + 1)*4
+        data_bytes = b''.join(frames for frames, _ in chunks)
+        host_ns = np.repeat(np.array([host_ns for _, host_ns in chunks], dtype=np.int64), [len(frames) // frame_size for frames, _ in chunks])
+        signals, exectimes = self.decode_frames(data_bytes, self.frame_num_sig)
+        return signals, exectimes, host_ns
             
+
+def valid_baud(baudstr: str):
+    try:
+        baud = int(baudstr)
+        if baud <= 0:
+            return False
+    except ValueError:
+        return False
+    return True
+
+def valid_timeout(timeoutstr: str):
+    try:
+        timeout = int(timeoutstr)
+        if timeout <= 0:
+            return False
+    except ValueError:
+        return False
+    return True
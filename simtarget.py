@@ -0,0 +1,155 @@
+import argparse, os, select, threading, time, tty, zlib
+import numpy as np
+
+class SimTarget:
+
+    def __init__(self, num_sig: int = 10, rate: float = 1000.0, latency: float = 0.0, noise: float = 0.01, corrupt: float = 0.0):
+        # Software target speaking the SBBTarget protocol on a pseudo-terminal (POSIX only)
+        self.num_sig = num_sig
+        self.rate = rate # Frame rate in stream mode (Hz)
+        self.latency = latency # Delay before answering the requests (s)
+        self.noise = noise # Standard deviation of the noise added to the signals
+        self.corrupt = corrupt # Probability of a frame being corrupted or cut short in framed mode
+        self.framed = False # Sample frames with sync marker, sequence number and CRC, set by the framing request
+        self.seq = 0 # Sequence number of the next frame
+        self.signal_names = [f"signal {i}" for i in range(num_sig)]
+        self.freqs = np.linspace(0.2, 5.0, num_sig) # Frequency of each sine signal (Hz)
+        self.channels = np.arange(num_sig) # Signals in the frames, set by the subscribe request
+        self.running = False
+        self.streaming = False
+        self.write_lock = threading.Lock()
+
+        # The host opens the slave side as a serial port
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.running = True
+        self.serve_thread = threading.Thread(target=self.serve, daemon=True)
+        self.stream_thread = threading.Thread(target=self.stream, daemon=True)
+        self.serve_thread.start()
+        self.stream_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.serve_thread.join()
+        self.stream_thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def frames(self, t, rng):
+        # Frames at the target times t: signal values followed by the exec time
+        vals = np.sin(2*np.pi*np.outer(t, self.freqs[self.channels]))
+        if self.noise > 0:
+            vals = vals + rng.normal(0, self.noise, vals.shape)
+        return np.column_stack((vals, t)).astype(np.float32)
+
+    def pack(self, frames, rng):
+        # Frames as sent on the link, framed and possibly corrupted in framed mode
+        if not self.framed:
+            return frames.tobytes()
+        packed = []
+        for frame in frames:
+            body = (self.seq % 65536).to_bytes(2, "little") + frame.tobytes()
+            self.seq = self.seq + 1
+            packed.append(b'\xa5\x5a' + body + zlib.crc32(body).to_bytes(4, "little"))
+            if self.corrupt > 0 and rng.random() < self.corrupt: # Flipped byte or truncated frame
+                damaged = bytearray(packed[-1])
+                if rng.random() < 0.5:
+                    damaged[int(rng.integers(len(damaged)))] ^= 0xff
+                else:
+                    del damaged[int(rng.integers(1, len(damaged))):]
+                packed[-1] = bytes(damaged)
+        return b''.join(packed)
+
+    def send(self, data: bytes):
+        with self.write_lock:
+            view = memoryview(data)
+            while len(view) > 0:
+                view = view[os.write(self.master, view):]
+
+    def serve(self):
+        rng = np.random.default_rng(0)
+        pending = bytearray()
+        while self.running:
+            if len(select.select([self.master], [], [], 0.05)[0]) == 0:
+                continue
+            pending += os.read(self.master, 4096)
+            if self.latency > 0: # Once per burst, as a link latency
+                time.sleep(self.latency)
+            while len(pending) > 0:
+                if pending[0] == 0x07: # Subscribe, followed by uint16 count and uint16 indexes
+                    if len(pending) < 3:
+                        break
+                    count = int.from_bytes(pending[1:3], "little")
+                    if len(pending) < 3 + 2*count:
+                        break
+                    indexes = np.frombuffer(bytes(pending[3:3 + 2*count]), dtype="<u2")
+                    self.channels = indexes.astype(np.int64) if count > 0 else np.arange(self.num_sig)
+                    del pending[:3 + 2*count]
+                    self.send(count.to_bytes(2, "little"))
+                    continue
+                if pending[0] == 0x08: # Framing, followed by 1 to enable or 0 to disable
+                    if len(pending) < 2:
+                        break
+                    self.framed = pending[1] == 1
+                    self.seq = 0
+                    self.send(bytes(pending[1:2]))
+                    del pending[:2]
+                    continue
+                self.reply(pending[0], rng)
+                del pending[:1]
+
+    def reply(self, request: int, rng):
+        if request == 0x01: # Signal values
+            self.send(self.frames(np.array([self.now()]), rng)[0, :-1].tobytes())
+        elif request == 0x02: # Exec time
+            self.send(np.float32(self.now()).tobytes())
+        elif request == 0x03: # Signal names
+            self.send(b''.join(name.encode("utf-8") + b'\0' for name in self.signal_names) + b'\n')
+        elif request == 0x04: # Start stream
+            self.stream_start = self.now()
+            self.stream_sent = 0
+            self.streaming = True
+        elif request == 0x05: # Stop stream
+            self.streaming = False
+        elif request == 0x06: # Signal values and exec time
+            self.send(self.pack(self.frames(np.array([self.now()]), rng), rng))
+
+    def stream(self):
+        rng = np.random.default_rng(1)
+        while self.running:
+            time.sleep(0.0005)
+            if not self.streaming:
+                continue
+            # Push the frames due since the last push in one write
+            due = int((self.now() - self.stream_start)*self.rate) - self.stream_sent
+            if due > 0:
+                t = self.stream_start + (self.stream_sent + np.arange(due))/self.rate
+                self.send(self.pack(self.frames(t, rng), rng))
+                self.stream_sent = self.stream_sent + due
+
+    def now(self):
+        return time.perf_counter() - self.start_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated SBB target on a pseudo-terminal")
+    parser.add_argument("--signals", type=int, default=10, help="number of signals")
+    parser.add_argument("--rate", type=float, default=1000.0, help="frame rate in stream mode (Hz)")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply latency (ms)")
+    parser.add_argument("--noise", type=float, default=0.01, help="noise standard deviation")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of a corrupt frame in framed mode")
+    args = parser.parse_args()
+
+    target = SimTarget(args.signals, args.rate, args.latency/1000, args.noise, args.corrupt)
+    target.start()
+    print(target.port, flush=True) # Port to open in the GUI
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    target.stop()
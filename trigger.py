@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+
+# Triggered capture: only windows of samples around trigger events are logged
+kinds = {"off": "No trigger", "above": "Above", "below": "Below", "rising": "Rising edge", "falling": "Falling edge", "rate": "Rate limit", "manual": "Manual"}
+
+class Trigger:
+
+    def __init__(self, kind: str, column: int = 0, level: float = 0.0, name: str = ""):
+        # Fires on a signal column of the acquired blocks:
+        # above/below the level, rising/falling through the level, or changing faster than level per second (rate)
+        if not(kind in kinds) or kind == "off":
+            raise ValueError(f"Unknown trigger {kind}")
+        self.kind = kind
+        self.column = column
+        self.level = level
+        self.name = name or kind # Recorded with each capture
+        self.last_value = np.nan # Last sample of the previous block, for edges and rates
+        self.last_time = np.nan
+
+    def detect(self, block, exectimes):
+        # Positions in the block of the samples the trigger fires on
+        if self.kind == "manual":
+            return np.zeros(0, dtype=np.int64)
+        values = block[:, self.column].astype(np.float64)
+        previous = np.concatenate(([self.last_value], values[:-1]))
+        if self.kind == "above":
+            fired = values > self.level
+        elif self.kind == "below":
+            fired = values < self.level
+        elif self.kind == "rising":
+            fired = (previous < self.level) & (values >= self.level)
+        elif self.kind == "falling":
+            fired = (previous > self.level) & (values <= self.level)
+        else: # Per second on the exec times, per sample without them
+            times = exectimes.astype(np.float64)
+            dt = np.diff(times, prepend=self.last_time)
+            dt = np.where(np.isfinite(dt) & (dt > 0), dt, 1.0)
+            fired = np.abs(values - previous)/dt > self.level
+        self.last_value = values[-1]
+        self.last_time = float(exectimes[-1])
+        return np.flatnonzero(fired) # Comparisons with NaN are False
+
+class Capture:
+
+    def __init__(self, triggers, num_sig: int, pre: int = 1000, post: int = 1000):
+        # Keeps the last pre samples in a ring buffer, and on a trigger writes them, the trigger
+        # sample and the post samples after it; triggers during a capture are ignored
+        self.triggers = triggers
+        self.pre = pre
+        self.post = post
+        self.ring_data = np.zeros((pre, num_sig), dtype=np.float32)
+        self.ring_exectimes = np.zeros(pre, dtype=np.float32)
+        self.ring_host_ns = np.zeros(pre, dtype=np.int64)
+        self.ring_count = 0 # Samples pushed since the last capture
+        self.ring_next = 0 # Sample index after the last one pushed
+        self.remaining = 0 # Samples of the current capture still to write
+        self.manual = threading.Event() # Set by fire, from any thread
+        self.captures = [] # Trigger, trigger sample, host time and first and last sample of each capture
+
+    def fire(self):
+        # Manual trigger, on the next acquired sample
+        self.manual.set()
+
+    def push(self, first_index: int, exectimes, block, host_ns):
+        # Add consecutive samples to the pre-trigger ring buffer, only the last pre are kept
+        if self.pre == 0 or len(block) == 0:
+            return
+        if len(block) > self.pre:
+            first_index = first_index + len(block) - self.pre
+            block, exectimes, host_ns = block[-self.pre:], exectimes[-self.pre:], host_ns[-self.pre:]
+        positions = (self.ring_count + np.arange(len(block))) % self.pre
+        self.ring_data[positions] = block
+        self.ring_exectimes[positions] = exectimes
+        self.ring_host_ns[positions] = host_ns
+        self.ring_count = self.ring_count + len(block)
+        self.ring_next = first_index + len(block)
+
+    def flush(self, write):
+        # Write the ring buffer, oldest sample first, and empty it
+        n = min(self.ring_count, self.pre)
+        if n > 0:
+            positions = (self.ring_count - n + np.arange(n)) % self.pre
+            write(self.ring_next - n, self.ring_exectimes[positions], self.ring_data[positions], self.ring_host_ns[positions])
+        self.ring_count = 0
+
+    def process(self, first_index: int, exectimes, block, host_ns, write):
+        # Pass the samples of the capture windows in the block to write(first_index, exectimes, block, host_ns)
+        fired = {} # Positions in the block where each trigger fires
+        for trigger in self.triggers:
+            positions = trigger.detect(block, exectimes)
+            if len(positions) > 0:
+                fired[trigger.name] = positions
+        if self.manual.is_set():
+            self.manual.clear()
+            fired["manual"] = np.zeros(1, dtype=np.int64)
+
+        pos = 0
+        while pos < len(block):
+            if self.remaining > 0: # Samples after the trigger
+                take = min(self.remaining, len(block) - pos)
+                write(first_index + pos, exectimes[pos:pos + take], block[pos:pos + take], host_ns[pos:pos + take])
+                self.remaining = self.remaining - take
+                pos = pos + take
+                self.captures[-1]["end"] = first_index + pos - 1 # Short if the execution stops first
+                continue
+
+            # Next firing of any trigger, the samples before it go to the ring buffer
+            firings = [(int(positions[np.searchsorted(positions, pos)]), name) for name, positions in fired.items() if positions[-1] >= pos]
+            if len(firings) == 0:
+                self.push(first_index + pos, exectimes[pos:], block[pos:], host_ns[pos:])
+                break
+            k, name = min(firings)
+            self.push(first_index + pos, exectimes[pos:k], block[pos:k], host_ns[pos:k])
+            start = first_index + k - min(self.ring_count, self.pre)
+            self.flush(write)
+            self.captures.append({"trigger": name, "sample": first_index + k, "host_ns": int(host_ns[k]), "start": start, "end": first_index + k - 1})
+            self.remaining = self.post + 1 # Trigger sample included
+            pos = k